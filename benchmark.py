@@ -0,0 +1,328 @@
+#Benchmarks for the event loop of the simulator
+#  python3 benchmark.py [dispatch] [peer counts...]   event throughput at several network sizes,
+#                                                     which should stay roughly flat as the number of peers grows
+#  python3 benchmark.py events                        heap push/pop throughput of the event representation
+#  python3 benchmark.py topology [peer counts...]     time to generate a connected network
+#  python3 benchmark.py suite [output.json] [--quick]  seeded end-to-end runs at 100/1k/10k peers and microbenchmarks
+#                                                     of the peer hot paths, saved as JSON to compare across commits
+#  python3 benchmark.py compare old.json new.json     speedup of every measurement between two suite results
+#  python3 benchmark.py relay [peer counts...]        block propagation delay and fork rate with full and compact block relay
+#  python3 benchmark.py scheduler [peer counts...]    heap and calendar schedulers on a hold model and on dense-traffic runs
+#  python3 benchmark.py parallel [worker counts...]   wall time and chain statistics of sequential and parallel runs on the same seeds
+#  python3 benchmark.py resume                        check that a run resumed with a longer duration keeps its transaction rate
+
+import contextlib
+import heapq
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from sim import build_simulation, Simulation
+from checkpoint import load_checkpoint
+from latency import LinkLatencies
+from event import new_event, BLK_RECEIVE, TXN_GENERATION
+from block import Block
+from transaction import Transaction
+from blocklog import load_block_log, propagation_stats
+from scheduler import SCHEDULERS
+
+#The event class used before events became tuples, kept for comparison
+class LegacyEvent:
+
+    def __init__(self, event_time, event_type, peer_id, data=None):
+        self.event_time=event_time
+        self.event_type=event_type
+        self.peer_id=peer_id
+        self.data=data
+
+    def __lt__(self, other):
+        return self.event_time < other.event_time
+
+#Function to build and run one seeded simulation, returns (events processed, seconds spent in run_simulation)
+def run_once(num_peers, mean_transaction_time, mean_block_generation_time, simulation_duration, seed=1):
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation=build_simulation(num_peers, 30, 30, mean_transaction_time, mean_block_generation_time, simulation_duration, 20, 20, seed)
+    start=time.perf_counter()
+    processed=simulation.run_simulation(simulation_duration)
+    return processed, time.perf_counter()-start
+
+def dispatch_scaling(peer_counts, mean_transaction_time=10, mean_block_generation_time=60, simulation_duration=200):
+    print(f"{'peers':>8} {'events':>10} {'seconds':>9} {'events/sec':>12}")
+    for num_peers in peer_counts:
+        processed, elapsed=run_once(num_peers, mean_transaction_time, mean_block_generation_time, simulation_duration)
+        print(f"{num_peers:>8} {processed:>10} {elapsed:>9.3f} {processed/elapsed:>12.0f}")
+
+#Function to time pushing num_events events on a heap of about queue_size events and popping them again
+def time_push_pop(make_event, num_events, queue_size):
+    rng=np.random.default_rng(1)
+    times=rng.exponential(1.0, size=num_events+queue_size).cumsum().tolist()
+    queue=[make_event(t, BLK_RECEIVE, 0, None) for t in times[:queue_size]]
+    heapq.heapify(queue)
+    start=time.perf_counter()
+    for t in times[queue_size:]:
+        heapq.heappush(queue, make_event(t, BLK_RECEIVE, 0, None))
+        heapq.heappop(queue)
+    return time.perf_counter()-start
+
+def event_push_pop(num_events=200000, queue_size=100000):
+    print(f"{'event form':>12} {'push+pop/sec':>14}")
+    for name, make_event in [('class', LegacyEvent), ('tuple', new_event)]:
+        elapsed=time_push_pop(make_event, num_events, queue_size)
+        print(f"{name:>12} {num_events/elapsed:>14.0f}")
+
+#Function to time generate_random_topology alone, peers are created beforehand
+def topology_build(peer_counts):
+    print(f"{'peers':>8} {'seconds':>9} {'min deg':>8} {'max deg':>8} {'connected':>10}")
+    for num_peers in peer_counts:
+        simulation=Simulation(num_peers, 30, 30, 0, seed=1)
+        simulation.initialize_peers(LinkLatencies(rng=simulation.streams.latency), 60, 20, 20)
+        start=time.perf_counter()
+        simulation.generate_random_topology()
+        elapsed=time.perf_counter()-start
+        degrees=np.diff(simulation.adjacency_offsets)
+        print(f"{num_peers:>8} {elapsed:>9.3f} {degrees.min():>8} {degrees.max():>8} {str(simulation.is_connected_graph()):>10}")
+
+#Workload of the end-to-end runs: (peers, mean txn time, mean block time, duration)
+SUITE_SCALES=[(100, 10, 60, 600), (1000, 10, 60, 200), (10000, 10, 60, 40)]
+
+#Function to run one end-to-end case, executed in a fresh process so its peak memory is its own
+def end_to_end_case(num_peers, mean_transaction_time, mean_block_generation_time, simulation_duration, seed=1):
+    start=time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation=build_simulation(num_peers, 30, 30, mean_transaction_time, mean_block_generation_time, simulation_duration, 20, 20, seed)
+    build_seconds=time.perf_counter()-start
+    start=time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        processed=simulation.run_simulation(simulation_duration)
+    run_seconds=time.perf_counter()-start
+    return {'peers': num_peers, 'duration': simulation_duration, 'events': processed,
+            'build_seconds': build_seconds, 'run_seconds': run_seconds, 'events_per_sec': processed/run_seconds,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024}
+
+#Function to time calls of fn over the items, returns calls per second
+def calls_per_sec(fn, items):
+    start=time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items)/(time.perf_counter()-start)
+
+#Function to time the peer hot paths on a simulation warmed up until its mempools and chains are filled
+def microbenchmarks(num_peers=200, warmup=600, calls=5000, seed=1):
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation=build_simulation(num_peers, 30, 30, 2, 120, warmup, 20, 20, seed)
+        simulation.run_simulation(warmup)
+    peers=simulation.peers
+    now=float(warmup)
+    results={}
+
+    txns=[Transaction(i % num_peers, (i+1) % num_peers, 1) for i in range(calls)]
+    results['receive_transaction']=calls_per_sec(lambda i: peers[i % num_peers].receive_transaction(txns[i], now), range(calls))
+    simulation.event_queue.clear()
+
+    results['generate_block']=calls_per_sec(lambda i: peers[i % num_peers].generate_block(now), range(calls))
+    simulation.event_queue.clear()
+
+    #Full blocks on top of the tip of the first peer
+    tip=peers[0].private_chain.last_block
+    template=peers[0].mempool.first(999)
+    def full_block():
+        block=Block(hash(tip), peers[0].peer_id, tip.index+1, tip.blk_id)
+        block.transactions.extend(template)
+        block.mine_time=now
+        return block
+    receivers=[peer for peer in peers if peer.private_chain.has_block(tip.blk_id)]
+    #The verdict is cached on the block after its first validation, so every call validates a new block
+    blocks=[full_block() for _ in range(calls)]
+    block=full_block()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results['validate_block']=calls_per_sec(lambda i: receivers[i % len(receivers)].validate_block(blocks[i]), range(calls))
+        #One block delivered once to every peer that shares that tip
+        results['receive_block']=calls_per_sec(lambda peer: peer.receive_block(now, block), receivers)
+    simulation.event_queue.clear()
+
+    for num in [1000, 10000]:
+        topology=Simulation(num, 30, 30, 0, seed=seed)
+        topology.initialize_peers(LinkLatencies(rng=topology.streams.latency), 60, 20, 20)
+        start=time.perf_counter()
+        topology.generate_random_topology()
+        results[f'topology_{num}_seconds']=time.perf_counter()-start
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(output, scales=SUITE_SCALES):
+    results={'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'end_to_end': []}
+    print(f"{'peers':>8} {'events':>10} {'seconds':>9} {'events/sec':>12} {'peak MB':>9}")
+    for scale in scales:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            case=pool.submit(end_to_end_case, *scale).result()
+        results['end_to_end'].append(case)
+        print(f"{case['peers']:>8} {case['events']:>10} {case['run_seconds']:>9.3f} {case['events_per_sec']:>12.0f} {case['peak_rss_mb']:>9.1f}")
+    results['micro']=microbenchmarks()
+    for name, value in results['micro'].items():
+        print(f"{name:>28} {value:>12.4g}")
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+
+#Function to print new/old of every measurement, above 1 means faster (or less time and memory)
+def compare(old_path, new_path):
+    with open(old_path) as file:
+        old=json.load(file)
+    with open(new_path) as file:
+        new=json.load(file)
+    print(f"{old['commit']} -> {new['commit']}")
+    old_cases={case['peers']: case for case in old['end_to_end']}
+    for case in new['end_to_end']:
+        before=old_cases.get(case['peers'])
+        if before:
+            print(f"{case['peers']:>8} peers  events/sec x{case['events_per_sec']/before['events_per_sec']:.2f}  peak memory x{before['peak_rss_mb']/case['peak_rss_mb']:.2f}")
+    for name, value in new['micro'].items():
+        if name in old['micro']:
+            ratio=old['micro'][name]/value if name.endswith('seconds') else value/old['micro'][name]
+            print(f"{name:>28} x{ratio:.2f}")
+
+#Workload of the relay comparison: many transactions per block so that block size matters
+RELAY_WORKLOAD=dict(mean_transaction_time=0.5, mean_block_generation_time=30, simulation_duration=900)
+
+#Function to run one seeded simulation with full or compact block relay, returns its propagation and fork statistics
+def relay_case(num_peers, compact, seed, mean_transaction_time, mean_block_generation_time, simulation_duration):
+    with tempfile.TemporaryDirectory() as directory:
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulation=build_simulation(num_peers, 30, 30, mean_transaction_time, mean_block_generation_time, simulation_duration, 20, 20, seed)
+            simulation.open_block_log(directory, 'binary')
+            simulation.instrument()
+            if compact:
+                simulation.enable_compact_relay()
+            simulation.run_simulation(simulation_duration)
+            simulation.write_files()
+        stats=propagation_stats(load_block_log(f'{directory}/block_tree.bin'), [miner.peer_id for miner in simulation.selfish_miners])
+    summary=simulation.mpu_stats()
+    stats['fork_rate']=summary['forks']/summary['total_blocks'] if summary['total_blocks'] else float('nan')
+    stats['mpu_adv1']=summary['mpu_adv1']
+    stats['blktxn_fetched']=simulation.instrumentation.blktxn_fetched
+    return stats
+
+#Function to compare full and compact block relay on the same seeds, averaged over the seeds
+def relay_comparison(peer_counts, seeds=(1, 2, 3)):
+    columns=['mean_delay', 'p90_delay', 'mean_spread', 'fork_rate', 'mpu_adv1', 'blktxn_fetched']
+    print(f"{'peers':>8} {'relay':>8} "+' '.join(f'{column:>14}' for column in columns))
+    for num_peers in peer_counts:
+        for compact in [False, True]:
+            cases=[relay_case(num_peers, compact, seed, **RELAY_WORKLOAD) for seed in seeds]
+            means=[np.nanmean([case[column] for case in cases]) for column in columns]
+            print(f"{num_peers:>8} {'compact' if compact else 'full':>8} "+' '.join(f'{mean:>14.4g}' for mean in means))
+
+#Function to time the hold model on a scheduler: num_events times pop the earliest event and push one
+#a random exponential time later, on a queue kept at queue_size events
+def scheduler_hold(make_scheduler, num_events, queue_size, mean_gap=1.0):
+    rng=np.random.default_rng(1)
+    gaps=(rng.exponential(mean_gap*queue_size, size=num_events+queue_size)).tolist()
+    scheduler=make_scheduler()
+    for i in range(queue_size):
+        scheduler.push(new_event(gaps[i], BLK_RECEIVE, 0, None))
+    push=scheduler.push
+    pop=scheduler.pop
+    start=time.perf_counter()
+    for gap in gaps[queue_size:]:
+        event=pop()
+        push(new_event(event[0]+gap, BLK_RECEIVE, 0, None))
+    return time.perf_counter()-start
+
+#Dense traffic: a transaction every 0.1 s keeps about a hundred thousand receive events pending at 1000 peers
+SCHEDULER_WORKLOAD=dict(mean_transaction_time=0.1, mean_block_generation_time=60, simulation_duration=60)
+
+#Function to compare the schedulers on the hold model and on seeded runs, which must process the same events
+def scheduler_comparison(peer_counts, seed=1):
+    print(f"{'queue size':>12} "+' '.join(f'{name+" ops/sec":>18}' for name in SCHEDULERS))
+    for queue_size in [1000, 100000, 1000000]:
+        print(f"{queue_size:>12} "+' '.join(f'{200000/scheduler_hold(make_scheduler, 200000, queue_size):>18.0f}' for make_scheduler in SCHEDULERS.values()))
+    print(f"{'peers':>8} {'scheduler':>10} {'events':>10} {'seconds':>9} {'events/sec':>12} {'max queue':>10} {'trace':>18}")
+    for num_peers in peer_counts:
+        for name in SCHEDULERS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                simulation=build_simulation(num_peers, 30, 30, seed=seed, scheduler=name, hashing_power1=20, hashing_power2=20, **SCHEDULER_WORKLOAD)
+            simulation.instrument()
+            trace=simulation.enable_trace_hash()
+            start=time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                processed=simulation.run_simulation(simulation.simulation_duration)
+            elapsed=time.perf_counter()-start
+            print(f"{num_peers:>8} {name:>10} {processed:>10} {elapsed:>9.3f} {processed/elapsed:>12.0f} {simulation.instrumentation.max_queue_depth:>10} {trace.hexdigest()[:16]:>18}")
+
+#Workload of the parallel comparison: (peers, mean txn time, mean block time, duration)
+PARALLEL_WORKLOAD=(2000, 1, 5, 200)
+
+#Function to run the same seeds sequentially and on each number of workers, printing the wall time and the
+#mean of the chain statistics, which should agree within their spread across seeds
+def parallel_comparison(worker_counts, seeds=(1, 2, 3, 4)):
+    num_peers, mean_transaction_time, mean_block_generation_time, simulation_duration=PARALLEL_WORKLOAD
+    columns=['total_blocks', 'forks', 'mpu_overall', 'mpu_adv1', 'mpu_adv2']
+    print(f"{'workers':>8} {'seconds':>9} "+' '.join(f'{column:>13}' for column in columns))
+    for workers in [1]+worker_counts:
+        elapsed=0.0
+        results=[]
+        for seed in seeds:
+            with contextlib.redirect_stdout(io.StringIO()):
+                simulation=build_simulation(num_peers, 30, 30, mean_transaction_time, mean_block_generation_time, simulation_duration, 20, 20, seed)
+                start=time.perf_counter()
+                if workers == 1:
+                    simulation.run_simulation(simulation_duration)
+                else:
+                    simulation.run_parallel(workers)
+                elapsed+=time.perf_counter()-start
+            results.append(simulation.mpu_stats())
+        means=[np.nanmean([result[column] for result in results]) for column in columns]
+        print(f"{workers:>8} {elapsed/len(seeds):>9.2f} "+' '.join(f'{mean:>13.4g}' for mean in means))
+
+#Function to run a simulation with a checkpoint halfway, resume it with a duration extended by the given factor and
+#compare the transactions generated after the checkpoint with those of a Poisson process of the run's mean.
+#Returns False if they are more than 4 standard deviations off.
+def resume_check(duration=1000, factor=3, mean_transaction_time=2, seed=1):
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        simulation=build_simulation(50, 30, 30, mean_transaction_time, 60, duration, 20, 20, seed)
+        simulation.enable_checkpoints(duration/2, directory)
+        simulation.run_simulation(duration)
+        resumed=load_checkpoint(os.path.join(directory, f"checkpoint_{duration/2:g}.pkl"))
+        resumed.simulation_duration=duration*factor
+        resumed.instrument()
+        resumed.run_simulation(resumed.simulation_duration)
+    generated=resumed.instrumentation.counts[TXN_GENERATION]
+    expected=(duration*factor-duration/2)/mean_transaction_time
+    print(f"transactions after the checkpoint: {generated}, expected {expected:.0f} +- {expected**0.5:.0f}")
+    return abs(generated-expected) <= 4*expected**0.5
+
+if __name__=="__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'suite':
+        arguments=[arg for arg in sys.argv[2:] if arg != '--quick']
+        scales=SUITE_SCALES[:2] if '--quick' in sys.argv else SUITE_SCALES
+        run_suite(arguments[0] if arguments else 'benchmark_results.json', scales)
+    elif len(sys.argv) > 3 and sys.argv[1] == 'compare':
+        compare(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'events':
+        event_push_pop()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'resume':
+        sys.exit(0 if resume_check() else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'parallel':
+        parallel_comparison([int(arg) for arg in sys.argv[2:]] or [2, 4])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'scheduler':
+        scheduler_comparison([int(arg) for arg in sys.argv[2:]] or [100, 1000])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'relay':
+        relay_comparison([int(arg) for arg in sys.argv[2:]] or [50, 200])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'topology':
+        topology_build([int(arg) for arg in sys.argv[2:]] or [1000, 10000, 100000])
+    else:
+        peer_counts=[int(arg) for arg in sys.argv[1:] if arg != 'dispatch'] or [100, 250, 500, 1000]
+        dispatch_scaling(peer_counts)
@@ -1,19 +1,31 @@
-import shortuuid
+from itertools import count
 from transaction import Coinbase
 
+#Block ids are small increasing integers in order of creation
+blk_ids=count()
+
 #Structure of each block
 class Block:
     def __init__(self, prev_hash, miner_id, index, prev_blk_id):
-        self.blk_id=shortuuid.uuid()
+        self.blk_id=next(blk_ids)
         self.prev_hash=prev_hash
         self.mine_time=0
         self.index=index
         self.transactions=[]
         coinbase=Coinbase(miner_id)
         self.transactions.append(coinbase)
-        self.balance=[]
+        self.ledger=None
         self.prev_blk_id=prev_blk_id
         self.miner_id = miner_id 
+    #Hash used as prev_hash by child blocks, unlike the default identity hash it survives checkpoints
+    def __hash__(self):
+        return hash(self.blk_id)
+
     #Function for adding transactions to the block
     def add_transaction(self, txn):
-        self.transactions.append(txn)
\ No newline at end of file
+        self.transactions.append(txn)
+
+    #Balances of all peers after this block, reconstructed from the ledger
+    @property
+    def balance(self):
+        return self.ledger.balances()
\ No newline at end of file
@@ -1,30 +1,84 @@
 from block import Block
 
-#Structure of blockchain in each peer
-class Blockchain:
+#Structure of the store holding every block of the simulation once, shared by all peers
+class BlockStore:
     def __init__(self):
-        self.blocks={}
+        self.blocks={} # blk_id -> block
+        self.children={} # blk_id -> ids of the blocks whose parent it is
+        self.heights={} # height -> ids of the blocks at that height
+        self.metrics=None # ChainMetrics told about every new block
+        self.rejected=set() # ids of the blocks whose transactions make a balance negative
+
+    def add(self, block):
+        if block.blk_id in self.blocks:
+            return
+        self.blocks[block.blk_id]=block
+        self.children.setdefault(block.prev_blk_id, []).append(block.blk_id)
+        self.heights.setdefault(block.index, []).append(block.blk_id)
+        if self.metrics is not None:
+            self.metrics.block_added(block)
+
+    #Function to get the ledger after the transactions of a block on top of its parent, None if a balance becomes negative.
+    #The verdict is the same at every peer, so the transactions of a block are applied once per simulation and
+    #kept as block.ledger, or in rejected.
+    def validate(self, block, parent):
+        if block.ledger is None and block.blk_id not in self.rejected:
+            block.ledger=parent.ledger.apply(block.transactions)
+            if block.ledger is None:
+                self.rejected.add(block.blk_id)
+        return block.ledger
+
+    def get(self, blk_id):
+        return self.blocks.get(blk_id)
+
+    def __len__(self):
+        return len(self.blocks)
+
+#Structure of blockchain in each peer, a view of the blocks it knows in the shared store
+class Blockchain:
+    def __init__(self, store=None):
+        self.store=store if store is not None else BlockStore()
+        self.known=set() # ids of the blocks in this chain
         self.last_block=None
-        self.blocks[0]=[]
+        self.metrics=None # ChainMetrics following the tip of this view
     
     #Function to add gebesis block to the blockchain    
     def add_genesis(self, genesis):
-        self.blocks[0]=[genesis]
+        self.store.add(genesis)
+        self.known.add(genesis.blk_id)
         self.last_block=genesis
+        if self.metrics is not None:
+            self.metrics.tip_changed(genesis)
 
     #Function to add a block to the blockchain and determine longest chain
     def add_block(self, block):
-        if block.index not in self.blocks:
-            self.blocks[block.index]=[block]
+        if block.blk_id in self.known:
+            return
+        self.store.add(block)
+        self.known.add(block.blk_id)
+        #The first block seen at a new height becomes the tip
+        if self.last_block is None or block.index > self.last_block.index:
             self.last_block=block
-        else:
-            self.blocks[block.index].append(block)
+            if self.metrics is not None:
+                self.metrics.tip_changed(block)
     
+    def has_block(self, blk_id):
+        return blk_id in self.known
+
     def find_block_by_id(self, blk_id):
-        for value in self.blocks.values():
-            for block in value:
-                if block.blk_id == blk_id:
-                    return block
+        if blk_id in self.known:
+            return self.store.blocks[blk_id]
         return None
-    
 
+    def get_children(self, blk_id):
+        return [self.store.blocks[child] for child in self.store.children.get(blk_id, []) if child in self.known]
+
+    #Function to get the blocks of this chain at a height
+    def blocks_at(self, index):
+        return [self.store.blocks[blk_id] for blk_id in self.store.heights.get(index, []) if blk_id in self.known]
+
+    def all_blocks(self):
+        return [self.store.blocks[blk_id] for blk_id in self.known]
+
+    def num_blocks(self):
+        return len(self.known)
\ No newline at end of file
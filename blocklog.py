@@ -0,0 +1,146 @@
+import os
+import numpy as np
+
+HEADER='block_index,miner_id,block_id,num_of_txns,mine_time,arrival_time'
+
+#Layout of one block arrival record in the binary log
+RECORD_DTYPE=np.dtype([('peer_id', 'i4'), ('block_index', 'i4'), ('miner_id', 'i4'), ('block_id', 'i8'),
+                       ('num_of_txns', 'i4'), ('mine_time', 'f8'), ('arrival_time', 'f8')])
+
+#Function to start a log file from its content at a checkpoint: the first size bytes of the file of the same name
+#in source_directory, the log directory of the checkpointed run. In the same directory the file is cut back in place.
+def continue_log(path, size, source_directory):
+    source=os.path.join(source_directory, os.path.basename(path))
+    if not os.path.exists(source) or os.path.getsize(source) < size:
+        raise ValueError(f"{source} holds less than at the checkpoint, the block log cannot be continued")
+    if os.path.abspath(source) == os.path.abspath(path):
+        os.truncate(path, size)
+        return
+    with open(source, 'rb') as src, open(path, 'wb') as dst:
+        while size > 0:
+            chunk=src.read(min(size, 1 << 20))
+            dst.write(chunk)
+            size-=len(chunk)
+
+#Streaming writer of block arrival records as CSV.
+#Records are buffered and appended to the files every buffer_size records, either one file per peer
+#(block_tree_<peer_id>, same columns as before) or one combined file with a leading peer_id column.
+#offsets (file name -> size, see offsets()) continues the files of a checkpointed run whose log was in source_directory
+#(this directory by default), files missing from it start anew.
+class CsvBlockLog:
+    def __init__(self, directory, peer_ids, combined=False, buffer_size=4096, offsets=None, source_directory=None):
+        self.directory=directory
+        self.combined=combined
+        self.buffer_size=buffer_size
+        self.buffers={}
+        self.buffered=0
+        os.makedirs(directory, exist_ok=True)
+        self.paths=[self.path(None)] if combined else [self.path(peer_id) for peer_id in peer_ids]
+        header='peer_id,'+HEADER if combined else HEADER
+        for path in self.paths:
+            if offsets is not None and os.path.basename(path) in offsets:
+                continue_log(path, offsets[os.path.basename(path)], source_directory or directory)
+            else:
+                with open(path, 'w') as file:
+                    file.write(header+'\n')
+
+    def path(self, peer_id):
+        if self.combined:
+            return os.path.join(self.directory, 'block_tree_all.csv')
+        return os.path.join(self.directory, f'block_tree_{peer_id}')
+
+    #Function to log the arrival of a block at a peer
+    def record(self, peer_id, block_index, miner_id, block_id, num_of_txns, mine_time, arrival_time):
+        line=f'{block_index},{miner_id},{block_id},{num_of_txns},{mine_time},{arrival_time}\n'
+        if self.combined:
+            line=f'{peer_id},'+line
+            peer_id=None
+        if peer_id not in self.buffers:
+            self.buffers[peer_id]=[]
+        self.buffers[peer_id].append(line)
+        self.buffered+=1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        for peer_id, lines in self.buffers.items():
+            with open(self.path(peer_id), 'a') as file:
+                file.writelines(lines)
+        self.buffers={}
+        self.buffered=0
+
+    #Function to get the size of every file of the log, after flushing it
+    def offsets(self):
+        self.flush()
+        return {os.path.basename(path): os.path.getsize(path) for path in self.paths}
+
+    def close(self):
+        self.flush()
+
+#Streaming writer of block arrival records as raw RECORD_DTYPE rows in one file (block_tree.bin), which is always combined
+class BinaryBlockLog:
+    def __init__(self, directory, peer_ids, combined=True, buffer_size=65536, offsets=None, source_directory=None):
+        os.makedirs(directory, exist_ok=True)
+        path=os.path.join(directory, 'block_tree.bin')
+        if offsets is not None and 'block_tree.bin' in offsets:
+            continue_log(path, offsets['block_tree.bin'], source_directory or directory)
+            self.file=open(path, 'ab')
+        else:
+            self.file=open(path, 'wb')
+        self.buffer_size=buffer_size
+        self.rows=[]
+
+    #Function to log the arrival of a block at a peer
+    def record(self, peer_id, block_index, miner_id, block_id, num_of_txns, mine_time, arrival_time):
+        self.rows.append((peer_id, block_index, miner_id, block_id, num_of_txns, mine_time, arrival_time))
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            np.array(self.rows, dtype=RECORD_DTYPE).tofile(self.file)
+            self.rows=[]
+        self.file.flush()
+
+    #Function to get the size of the log file, after flushing it
+    def offsets(self):
+        self.flush()
+        return {'block_tree.bin': self.file.tell()}
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+LOG_FORMATS={'csv': CsvBlockLog, 'binary': BinaryBlockLog}
+
+#Function to load a block log as a structured array with the fields of RECORD_DTYPE.
+#Accepts block_tree.bin, block_tree_all.csv or a per-peer block_tree_<peer_id> file.
+def load_block_log(path):
+    if path.endswith('.bin'):
+        return np.fromfile(path, dtype=RECORD_DTYPE)
+    with open(path) as file:
+        header=file.readline().strip().split(',')
+        rows=[tuple(line.strip().split(',')) for line in file if line.strip()]
+    records=np.zeros(len(rows), dtype=RECORD_DTYPE)
+    if header[0] != 'peer_id':
+        peer_id=int(os.path.basename(path).rsplit('_', 1)[-1])
+        rows=[(peer_id,)+row for row in rows]
+    for i, name in enumerate(RECORD_DTYPE.names):
+        records[name]=[row[i] for row in rows]
+    return records
+
+#Function to get the propagation delays of the mined blocks in a block log (as returned by load_block_log).
+#A delay is the time from mining a block until its arrival at a peer other than its miner, the spread
+#of a block is the delay until the last peer that received it. Blocks of the miners in exclude_miners are
+#left out, as selfish miners withhold their blocks on purpose.
+def propagation_stats(records, exclude_miners=()):
+    records=records[(records['miner_id'] != -1) & (records['peer_id'] != records['miner_id'])]
+    records=records[~np.isin(records['miner_id'], list(exclude_miners))]
+    if len(records) == 0:
+        return {'arrivals': 0, 'mean_delay': float('nan'), 'median_delay': float('nan'), 'p90_delay': float('nan'), 'mean_spread': float('nan')}
+    delays=records['arrival_time']-records['mine_time']
+    block_ids, inverse=np.unique(records['block_id'], return_inverse=True)
+    spreads=np.zeros(len(block_ids))
+    np.maximum.at(spreads, inverse, delays)
+    return {'arrivals': int(len(delays)), 'mean_delay': float(delays.mean()), 'median_delay': float(np.median(delays)),
+            'p90_delay': float(np.percentile(delays, 90)), 'mean_spread': float(spreads.mean())}
@@ -0,0 +1,85 @@
+import os
+import pickle
+from itertools import count
+
+import block
+import event
+import transaction
+
+CHECKPOINT_VERSION=6
+
+#Function to take the next value of an id counter and put a fresh counter starting there in its module
+def take_counter(module, name):
+    value=next(getattr(module, name))
+    setattr(module, name, count(value))
+    return value
+
+#Function to restart the id counters, so a new simulation in the same process is numbered like the first one
+def reset_counters():
+    event.event_sequence=count()
+    transaction.txn_ids=count()
+    block.blk_ids=count()
+
+#Function to write the full state of a running simulation: the scheduler with its events, peers, chains, mempools,
+#random streams and id counters. Streaming block logs are flushed and left out, as they hold open files, but
+#the sizes of their files are kept. So is the trace hash, whose digest cannot be pickled, and the instrumentation,
+#which belongs to this process: a resumed run is profiled only when it asks for it. The checkpoint settings
+#are left out too, so a resumed run never overwrites the checkpoints of the run it was loaded from unless asked to.
+def save_checkpoint(simulation, path):
+    block_log=simulation.block_log
+    trace=simulation.trace
+    instrumentation=simulation.instrumentation
+    profile_path=simulation.profile_path
+    checkpoint_settings=(simulation.checkpoint_interval, simulation.checkpoint_dir, simulation.next_checkpoint)
+    simulation.trace=None
+    simulation.instrumentation=None
+    simulation.profile_path=None
+    simulation.checkpoint_interval, simulation.checkpoint_dir, simulation.next_checkpoint=None, None, None
+    for peer in simulation.peer_table:
+        peer.instrumentation=None
+    if block_log is not None:
+        #A resumed run cuts the files back to these sizes, so it does not repeat what this run writes after the checkpoint
+        simulation.log_offsets=block_log.offsets()
+        simulation.block_log=None
+        for peer in simulation.peer_table:
+            peer.block_log=None
+    state={
+        'version': CHECKPOINT_VERSION,
+        #Blocks go first in creation order, so the parent of every ledger is already pickled and
+        #the pickler never recurses along a whole chain
+        'blocks': [simulation.block_store.blocks[blk_id] for blk_id in sorted(simulation.block_store.blocks)],
+        'simulation': simulation,
+        'counters': {'event_sequence': take_counter(event, 'event_sequence'),
+                     'txn_ids': take_counter(transaction, 'txn_ids'),
+                     'blk_ids': take_counter(block, 'blk_ids')},
+    }
+    try:
+        with open(path+'.tmp', 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path+'.tmp', path)
+    finally:
+        simulation.trace=trace
+        simulation.instrumentation=instrumentation
+        simulation.profile_path=profile_path
+        simulation.checkpoint_interval, simulation.checkpoint_dir, simulation.next_checkpoint=checkpoint_settings
+        for peer in simulation.peer_table:
+            peer.instrumentation=instrumentation
+        if block_log is not None:
+            simulation.block_log=block_log
+            for peer in simulation.peer_table:
+                peer.block_log=block_log
+
+#Function to restore a checkpoint into this process, returns the simulation ready to continue with run_simulation.
+#With fork_seed the random streams of the simulation are reseeded, so several continuations of one checkpoint can differ.
+def load_checkpoint(path, fork_seed=None):
+    with open(path, 'rb') as file:
+        state=pickle.load(file)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} is not a checkpoint of version {CHECKPOINT_VERSION}")
+    event.event_sequence=count(state['counters']['event_sequence'])
+    transaction.txn_ids=count(state['counters']['txn_ids'])
+    block.blk_ids=count(state['counters']['blk_ids'])
+    simulation=state['simulation']
+    if fork_seed is not None:
+        simulation.streams.reseed(fork_seed)
+    return simulation
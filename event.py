@@ -1,11 +1,22 @@
-#Structure of a event in the event queue
-class Event:
+from itertools import count
 
-    def __init__(self, event_time, event_type, peer_id, data=None):
-        self.event_time=event_time
-        self.event_type=event_type
-        self.peer_id=peer_id
-        self.data=data
+#Integer codes of the event types, used as indices into the dispatch tables of the simulation
+TXN_GENERATION=0
+TXN_RECEIVE=1
+BLK_GENERATION=2
+BLK_MINING=3
+BLK_RECEIVE=4
+#Compact block relay: announcement of a block, request of its missing transactions and the response
+BLK_ANNOUNCE=5
+BLKTXN_REQUEST=6
+BLKTXN_RESPONSE=7
+EVENT_NAMES=['txn_generation', 'txn_receive', 'blk_generation', 'blk_mining', 'blk_receive',
+             'blk_announce', 'blktxn_request', 'blktxn_response']
 
-    def __lt__(self, other): #For Comparisons in Event Priority Queue
-        return self.event_time < other.event_time
\ No newline at end of file
+#Sequence numbers break ties between events with the same time in order of creation
+event_sequence=count()
+
+#Structure of a event in the event queue: (event_time, seq, event_type, peer_id, data)
+#Tuples compare in C on time and then on the unique seq, so data is never compared
+def new_event(event_time, event_type, peer_id, data=None):
+    return (event_time, next(event_sequence), event_type, peer_id, data)
\ No newline at end of file
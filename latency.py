@@ -0,0 +1,25 @@
+import numpy as np
+
+#Speed of light delays of the links of the network, stored only for the edges that exist.
+#A delay is drawn the first time an edge is looked up and is the same in both directions.
+class LinkLatencies:
+    def __init__(self, low=0.01, high=0.5, rng=None):
+        self.low=low
+        self.high=high
+        self.rng=rng if rng is not None else np.random.default_rng() # latency stream of the run, see rng.py
+        self.delays={} # (smaller peer_id, larger peer_id) -> delay in seconds
+
+    def get(self, peer_id1, peer_id2):
+        key=(peer_id1, peer_id2) if peer_id1 < peer_id2 else (peer_id2, peer_id1)
+        delay=self.delays.get(key)
+        if delay is None:
+            delay=self.low+(self.high-self.low)*self.rng.random()
+            self.delays[key]=delay
+        return delay
+
+    #Function to forget all delays, used when the topology is generated again
+    def clear(self):
+        self.delays={}
+
+    def __len__(self):
+        return len(self.delays)
\ No newline at end of file
@@ -0,0 +1,72 @@
+from transaction import Coinbase
+
+#Number of blocks between two full copies of the balances
+CHECKPOINT_INTERVAL=64
+
+#Structure of the balances after a block, stored as the change made by the block on top of its parent.
+#Every CHECKPOINT_INTERVAL blocks the full balance list is kept so reads never walk far.
+class Ledger:
+    def __init__(self, parent=None, delta=None, checkpoint=None):
+        self.parent=parent
+        self.delta=delta if delta is not None else {} # peer_id -> change in balance
+        self.checkpoint=checkpoint # full balance list, or None
+        if checkpoint is not None:
+            self.num_accounts=len(checkpoint)
+            self.depth=0
+        else:
+            self.num_accounts=parent.num_accounts
+            self.depth=parent.depth+1
+            if self.depth >= CHECKPOINT_INTERVAL:
+                self.checkpoint=self.balances()
+                self.depth=0
+
+    #Function to get the balances of the given accounts
+    def get_balances(self, accounts):
+        result=dict.fromkeys(accounts, 0)
+        ledger=self
+        while ledger.checkpoint is None:
+            delta=ledger.delta
+            if len(delta) < len(result):
+                for account, change in delta.items():
+                    if account in result:
+                        result[account]+=change
+            else:
+                for account in result:
+                    if account in delta:
+                        result[account]+=delta[account]
+            ledger=ledger.parent
+        for account in result:
+            result[account]+=ledger.checkpoint[account]
+        return result
+
+    #Function to reconstruct the full balance list
+    def balances(self):
+        if self.checkpoint is not None:
+            return self.checkpoint[:]
+        deltas=[]
+        ledger=self
+        while ledger.checkpoint is None:
+            deltas.append(ledger.delta)
+            ledger=ledger.parent
+        balance=ledger.checkpoint[:]
+        for delta in deltas:
+            for account, change in delta.items():
+                balance[account]+=change
+        return balance
+
+    #Function to apply the transactions of a block, returns the new ledger or None if any balance becomes negative
+    def apply(self, transactions):
+        delta={}
+        for txn in transactions:
+            if isinstance(txn, Coinbase):
+                delta[txn.miner]=delta.get(txn.miner, 0)+50
+            else:
+                delta[txn.sender]=delta.get(txn.sender, 0)-txn.amount
+                delta[txn.receiver]=delta.get(txn.receiver, 0)+txn.amount
+        #Only accounts that lost coins can become negative
+        spenders=[account for account, change in delta.items() if change < 0]
+        if spenders:
+            for account, balance in self.get_balances(spenders).items():
+                if balance+delta[account] < 0:
+                    return None
+        return Ledger(self, delta)
@@ -0,0 +1,55 @@
+from collections import deque
+from itertools import islice
+
+#Structure of the pool of unconfirmed transactions in each peer.
+#The block template, the first template_size pending transactions by arrival, is kept up to date as
+#transactions arrive and are confirmed, so starting to mine a block only copies it.
+class Mempool:
+    def __init__(self, template_size=999):
+        self.pending={} # txn_id -> txn, kept in order of arrival
+        self.confirmed=set() # txn_ids already included in an accepted block
+        self.template_size=template_size
+        self.template={} # txn_id -> txn of the first template_size pending transactions
+        self.overflow=deque() # later transactions by arrival, the ones confirmed meanwhile are skipped when refilling
+
+    def __len__(self):
+        return len(self.pending)
+
+    #Function to check whether a transaction was already received or confirmed
+    def seen(self, txn):
+        return txn.txn_id in self.pending or txn.txn_id in self.confirmed
+
+    #Function to add a new transaction, returns False if it was already seen
+    def add(self, txn):
+        if self.seen(txn):
+            return False
+        self.pending[txn.txn_id]=txn
+        if len(self.template) < self.template_size:
+            self.template[txn.txn_id]=txn
+        else:
+            self.overflow.append(txn)
+        return True
+
+    #Function to get the transactions of a list that were never received nor confirmed
+    def missing(self, transactions):
+        pending=self.pending
+        confirmed=self.confirmed
+        return [txn for txn in transactions if txn.txn_id not in pending and txn.txn_id not in confirmed]
+
+    #Function to mark a transaction of an accepted block as confirmed
+    def confirm(self, txn):
+        self.pending.pop(txn.txn_id, None)
+        self.confirmed.add(txn.txn_id)
+        if self.template.pop(txn.txn_id, None) is not None:
+            while self.overflow and len(self.template) < self.template_size:
+                next_txn=self.overflow.popleft()
+                if next_txn.txn_id in self.pending:
+                    self.template[next_txn.txn_id]=next_txn
+
+    #Function to get the transactions of the next block, the first template_size pending transactions by arrival
+    def block_template(self):
+        return list(self.template.values())
+
+    #Function to get the first n pending transactions by arrival
+    def first(self, n):
+        return list(islice(self.pending.values(), n))
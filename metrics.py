@@ -0,0 +1,60 @@
+#Online chain metrics, updated as blocks are stored and as the tip of a reference view moves,
+#so MPU and fork counts are available at any time without walking the block trees.
+class ChainMetrics:
+    def __init__(self, store, adversaries):
+        self.store=store
+        self.adversaries=adversaries # peer_ids of the selfish miners
+        self.mined={} # miner_id -> blocks mined
+        self.total_mined=0
+        self.forks=0 # blocks stored on a parent that already had a child
+        self.main_chain={} # miner_id -> blocks in the main chain of the reference view
+        self.main_chain_length=0
+        self.tip=None
+
+    #Called by the block store for every new block
+    def block_added(self, block):
+        if block.miner_id == -1:
+            return
+        self.mined[block.miner_id]=self.mined.get(block.miner_id, 0)+1
+        self.total_mined+=1
+        if len(self.store.children[block.prev_blk_id]) > 1:
+            self.forks+=1
+
+    def count(self, block, change):
+        if block.miner_id != -1:
+            self.main_chain[block.miner_id]=self.main_chain.get(block.miner_id, 0)+change
+            self.main_chain_length+=change
+
+    #Called by the reference view when its tip changes, walks back only over the blocks that changed
+    def tip_changed(self, new_tip):
+        old_tip=self.tip
+        self.tip=new_tip
+        added=[]
+        while old_tip is not None and new_tip.index > old_tip.index:
+            added.append(new_tip)
+            new_tip=self.store.blocks.get(new_tip.prev_blk_id)
+        while old_tip is not None and new_tip is not None and old_tip.blk_id != new_tip.blk_id:
+            self.count(old_tip, -1)
+            added.append(new_tip)
+            old_tip=self.store.blocks.get(old_tip.prev_blk_id)
+            new_tip=self.store.blocks.get(new_tip.prev_blk_id)
+        if old_tip is None:
+            added.append(new_tip)
+        for block in added:
+            self.count(block, 1)
+
+    def mpu_overall(self):
+        return self.main_chain_length/self.total_mined if self.total_mined else float('nan')
+
+    def mpu(self, miner_id):
+        mined=self.mined.get(miner_id, 0)
+        return self.main_chain.get(miner_id, 0)/mined if mined else float('nan')
+
+    def summary(self):
+        summary={'main_chain_blocks': self.main_chain_length, 'total_blocks': self.total_mined,
+                 'mpu_overall': self.mpu_overall(), 'forks': self.forks}
+        for i, miner_id in enumerate(self.adversaries, 1):
+            summary[f'adv{i}_main_chain_blocks']=self.main_chain.get(miner_id, 0)
+            summary[f'adv{i}_total_blocks']=self.mined.get(miner_id, 0)
+            summary[f'mpu_adv{i}']=self.mpu(miner_id)
+        return summary
@@ -1,30 +1,36 @@
+import csv
+import sys
 import matplotlib.pyplot as plt
 import numpy as np
 
-mc_blocks_adv=np.array([4, 10, 9])
-mc_blocks=np.array([23, 17, 10])
-tot_blocks_adv=np.array([13, 12, 9])
-tot_blocks=np.array([52, 42, 23])
-hashing_power=np.array([20, 30, 50])
+#Function to plot MPU curves, series maps a label to (means, confidence interval half widths)
+def plot_mpu(x, series, xlabel, filename=None):
+    plt.figure(figsize=(8, 6))
 
-mpu_adv=mc_blocks_adv/ mc_blocks
-mpu_overall=tot_blocks_adv/ tot_blocks
+    markers=['o', 's', '^', 'd']
+    for i, (label, (means, cis)) in enumerate(series.items()):
+        plt.errorbar(x, means, yerr=np.nan_to_num(cis), label=label, marker=markers[i % len(markers)], capsize=3)
 
-# Plotting
-plt.figure(figsize=(8, 6))
+    # Labeling and titles
+    plt.xlabel(xlabel)
+    plt.ylabel('MPU')
+    plt.title(f'MPU vs {xlabel}')
+    plt.legend()
 
-# Plot mpu_adv
-plt.plot(hashing_power, mpu_adv, label='mpu_adv', marker='o')
+    plt.grid(True)
+    if filename:
+        plt.savefig(filename)
+    else:
+        plt.show()
+    plt.close()
 
-# Plot mpu_overall
-plt.plot(hashing_power, mpu_overall, label='mpu_overall', marker='s')
-
-# Labeling and titles
-plt.xlabel('Hashing Power')
-plt.ylabel('MPU')
-plt.title('MPU vs Hashing Power')
-plt.legend()
-
-# Display the plot
-plt.grid(True)
-plt.show()
+#Plotting MPU vs Hashing Power of selfish miner 1 from a results table written by sweep.py
+if __name__=="__main__":
+    path=sys.argv[1] if len(sys.argv) > 1 else 'sweep_results/results.csv'
+    with open(path) as file:
+        rows=sorted(csv.DictReader(file), key=lambda row: float(row['h1']))
+    hashing_power=[float(row['h1']) for row in rows]
+    series={}
+    for column in ['mpu_adv1', 'mpu_adv2', 'mpu_overall']:
+        series[column]=([float(row[column]) for row in rows], [float(row[column+'_ci']) for row in rows])
+    plot_mpu(hashing_power, series, 'Hashing Power')
\ No newline at end of file
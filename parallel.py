@@ -0,0 +1,252 @@
+#Conservative parallel execution of a simulation across worker processes.
+#The peers are split into partitions, each run by a worker with its own event queue. Every link
+#delays a message by at least its speed of light delay, so a message sent at time t reaches another
+#partition no earlier than t+lookahead, the smallest delay of a link between two partitions. The
+#workers run in windows: all process their events before min(next event)+lookahead, then the
+#messages between partitions are exchanged, and no worker ever receives a message from its past.
+#Each partition draws from its own random streams and generates the transactions of its own peers,
+#so a parallel run matches a sequential run statistically, not event for event.
+
+import copy
+import multiprocessing
+from collections import namedtuple
+from itertools import count
+
+import block
+import transaction
+from block import Block
+from blockchain import BlockStore
+from event import new_event, TXN_GENERATION
+from metrics import ChainMetrics
+from sim import EVENT_HANDLERS, DRAIN_HANDLERS, TransactionArrivals
+
+#What the coordinator needs of a block to compute the chain metrics, see ChainMetrics
+BlockRecord=namedtuple('BlockRecord', ['blk_id', 'prev_blk_id', 'index', 'miner_id'])
+
+#Function to split the peers into num_partitions groups of about equal size by cutting a breadth first
+#order of the network, so that most neighbours end up in the same partition. Returns the partition of each peer_id.
+def partition_peers(simulation, num_partitions):
+    n=len(simulation.peer_table)
+    offsets=simulation.adjacency_offsets.tolist()
+    adjacency=simulation.adjacency.tolist()
+    seen=[False]*n
+    order=[]
+    for start in range(n):
+        if seen[start]:
+            continue
+        seen[start]=True
+        order.append(start)
+        i=len(order)-1
+        while i < len(order):
+            peer_id=order[i]
+            for neighbour in adjacency[offsets[peer_id]:offsets[peer_id+1]]:
+                if not seen[neighbour]:
+                    seen[neighbour]=True
+                    order.append(neighbour)
+            i+=1
+    size=-(-n//num_partitions)
+    owner=[0]*n
+    for position, peer_id in enumerate(order):
+        owner[peer_id]=position//size
+    return owner
+
+#Function to get the lookahead of a partitioning: the smallest speed of light delay of a link between two partitions
+def lookahead(simulation, owner):
+    delays=[delay for peer in simulation.peer_table for neighbour_id, delay, c, queuing_mean in peer.links
+            if owner[neighbour_id] != owner[peer.peer_id]]
+    return min(delays) if delays else float('inf')
+
+#Scheduler of a worker: events of its own peers go into its queue, events of other peers into the outbox
+class PartitionQueue:
+    def __init__(self, queue, owner, partition):
+        self.queue=queue
+        self.owner=owner
+        self.partition=partition
+        self.outbox=[]
+        self.pop=queue.pop
+
+    def push(self, event):
+        if self.owner[event[3]] == self.partition:
+            self.queue.push(event)
+        else:
+            self.outbox.append(event)
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add_tombstone(self):
+        self.queue.add_tombstone()
+
+    def remove_tombstone(self):
+        self.queue.remove_tombstone()
+
+    def clear(self):
+        self.queue.clear()
+        self.outbox=[]
+
+    def events(self):
+        return self.queue.events()
+
+#Function to strip the ledger from the blocks in the data of an outgoing event, receivers validate and
+#compute it again. copies holds one stripped copy per block, so a block is pickled once per exchange.
+def to_wire(data, copies):
+    if isinstance(data, Block):
+        wire=copies.get(data.blk_id)
+        if wire is None:
+            wire=copy.copy(data)
+            wire.ledger=None
+            copies[data.blk_id]=wire
+        return wire
+    if type(data) is tuple:
+        return tuple(to_wire(item, copies) for item in data)
+    return data
+
+#Function to replace the blocks in the data of an incoming event by the object this worker already knows,
+#from its block store or an earlier message, so that every block is a single object within a worker
+def from_wire(data, store, blocks):
+    if isinstance(data, Block):
+        known=store.get(data.blk_id)
+        if known is None:
+            known=blocks.setdefault(data.blk_id, data)
+        return known
+    if type(data) is tuple:
+        return tuple(from_wire(item, store, blocks) for item in data)
+    return data
+
+#Function to prepare the copy of the simulation in a worker for running only the peers of its partition
+def setup_partition(simulation, owner, partition, num_partitions):
+    simulation.streams.reseed([simulation.streams.seed, partition+1])
+    #Ids stay unique across workers by interleaving them
+    block.blk_ids=count(next(block.blk_ids)+partition, num_partitions)
+    transaction.txn_ids=count(next(transaction.txn_ids)+partition, num_partitions)
+
+    pending=simulation.event_queue.events()
+    queue=PartitionQueue(simulation.event_queue, owner, partition)
+    queue.clear()
+    simulation.event_queue=queue
+    for peer in simulation.peer_table:
+        peer.event_queue=queue
+    arrivals=None
+    for event in sorted(pending):
+        if event[2] == TXN_GENERATION:
+            arrivals=event[4]
+        elif owner[event[3]] == partition:
+            queue.push(event)
+    #Transactions of the partition's honest peers, a Poisson process thinned to their share of all honest peers
+    local_peers=[peer for peer in simulation.peers if owner[peer.peer_id] == partition]
+    if arrivals is not None and local_peers:
+        simulation.arrivals=TransactionArrivals(simulation, arrivals.mean_transaction_time*len(simulation.peers)/len(local_peers), local_peers)
+        simulation.arrivals.schedule_next(0.0)
+    return queue
+
+#Function to get the time of the next event of a queue, inf if it is empty
+def next_event_time(queue):
+    try:
+        event=queue.pop()
+    except IndexError:
+        return float('inf')
+    queue.push(event)
+    return event[0]
+
+#Main loop of a worker process: receives (window end, incoming events) and answers with (outgoing events,
+#time of its next event), until it receives None and answers with its results
+def run_partition(simulation, owner, partition, num_partitions, snapshot_peers, connection):
+    queue=setup_partition(simulation, owner, partition, num_partitions)
+    raw=queue.queue
+    pop=raw.pop
+    peer_table=simulation.peer_table
+    duration=simulation.simulation_duration
+    blocks={} # blk_id -> block received from other partitions
+    processed=0
+    connection.send(([], next_event_time(raw)))
+    while True:
+        message=connection.recv()
+        if message is None:
+            break
+        window_end, inbox=message
+        for event_time, _, event_type, peer_id, data in inbox:
+            raw.push(new_event(event_time, event_type, peer_id, from_wire(data, simulation.block_store, blocks)))
+        while True:
+            try:
+                event=pop()
+            except IndexError:
+                break
+            if event[0] >= window_end:
+                raw.push(event)
+                break
+            current_time, _, event_type, peer_id, data = event
+            handlers=EVENT_HANDLERS if current_time <= duration else DRAIN_HANDLERS
+            handlers[event_type](peer_table[peer_id], current_time, data)
+            processed+=1
+        copies={}
+        outbox=[(event_time, seq, event_type, peer_id, to_wire(data, copies)) for event_time, seq, event_type, peer_id, data in queue.outbox]
+        queue.outbox=[]
+        connection.send((outbox, next_event_time(raw)))
+
+    simulation.write_files()
+    #Blocks mined in this partition, and the genesis block once
+    records=[BlockRecord(b.blk_id, b.prev_blk_id, b.index, b.miner_id) for b in simulation.block_store.blocks.values()
+             if (b.miner_id == -1 and partition == 0) or (b.miner_id != -1 and owner[b.miner_id] == partition)]
+    reference=simulation.peer_table[0]
+    tip=reference.private_chain.last_block.blk_id if owner[0] == partition else None
+    snapshots={peer_id: simulation.tree_snapshot(peer_table[peer_id]) for peer_id in snapshot_peers if owner[peer_id] == partition}
+    connection.send((processed, records, tip, snapshots))
+    connection.close()
+
+#Function to run a built simulation (see build_simulation) on num_partitions worker processes.
+#Returns the number of events processed, ChainMetrics of the whole run as seen by peer 0 and the
+#tree snapshots of the peers in snapshot_peers.
+def run_parallel(simulation, num_partitions, snapshot_peers=()):
+    owner=partition_peers(simulation, num_partitions)
+    window=lookahead(simulation, owner)
+    context=multiprocessing.get_context()
+    connections=[]
+    workers=[]
+    for partition in range(num_partitions):
+        parent, child=context.Pipe()
+        worker=context.Process(target=run_partition, args=(simulation, owner, partition, num_partitions, list(snapshot_peers), child))
+        worker.start()
+        child.close()
+        connections.append(parent)
+        workers.append(worker)
+
+    inboxes=[[] for _ in range(num_partitions)]
+    next_times=[0.0]*num_partitions
+    while True:
+        for partition, connection in enumerate(connections):
+            outbox, next_times[partition]=connection.recv()
+            for event in outbox:
+                inboxes[owner[event[3]]].append(event)
+        next_time=min(next_times)
+        for inbox in inboxes:
+            if inbox:
+                next_time=min(next_time, min(event[0] for event in inbox))
+        if next_time == float('inf'):
+            break
+        for partition, connection in enumerate(connections):
+            #Messages from several partitions, in order of time and then of the sending partition
+            inboxes[partition].sort(key=lambda event: event[0])
+            connection.send((next_time+window, inboxes[partition]))
+        inboxes=[[] for _ in range(num_partitions)]
+
+    processed=0
+    store=BlockStore()
+    metrics=ChainMetrics(store, [miner.peer_id for miner in simulation.selfish_miners])
+    store.metrics=metrics
+    records=[]
+    tip=None
+    snapshots={}
+    for connection in connections:
+        connection.send(None)
+        worker_processed, worker_records, worker_tip, worker_snapshots=connection.recv()
+        processed+=worker_processed
+        records.extend(worker_records)
+        tip=worker_tip if worker_tip is not None else tip
+        snapshots.update(worker_snapshots)
+    for worker in workers:
+        worker.join()
+    for record in sorted(records):
+        store.add(record)
+    metrics.tip=next(record for record in records if record.miner_id == -1)
+    metrics.tip_changed(store.get(tip))
+    return processed, metrics, snapshots
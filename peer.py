@@ -1,132 +1,167 @@
-import random
 import sys
-import numpy as np
-import heapq
 
 
 from blockchain import Blockchain
 from transaction import Transaction
-from event import Event
+from event import new_event, TXN_RECEIVE, BLK_MINING, BLK_RECEIVE, BLK_ANNOUNCE, BLKTXN_REQUEST, BLKTXN_RESPONSE
 from block import Block
-from transaction import Coinbase
+from mempool import Mempool
+from rng import RandomStreams
+from scheduler import HeapScheduler
 
-event_queue=[]
+#Sizes of the messages between peers in bits, a transaction is 1000 bytes
+TXN_BITS=1000*8
+HEADER_BITS=80*8
+SHORT_ID_BITS=6*8 # short transaction id of a compact block
+MAX_BLOCK_TXNS=1000 # transactions in a block, the coinbase included
 
 class Peer:
 
-    def __init__(self, peer_id, is_slow, is_low_cpu, speed_of_light_delay, hashing_power, mean_block_generation_time, num_peers, selfish_miner=False):
+    def __init__(self, peer_id, is_slow, is_low_cpu, speed_of_light_delay, hashing_power, mean_block_generation_time, num_peers, selfish_miner=False, block_store=None, streams=None, event_queue=None):
         self.peer_id=peer_id
         self.is_slow=is_slow
         self.is_low_cpu=is_low_cpu
         self.all_peers = range(num_peers)
         self.neighbours = []
-        self.transactions = []
-        self.used_txns = []
-        self.speed_of_light_delay=speed_of_light_delay
-        self.blockchain=Blockchain()
+        self.links = [] # (neighbour_id, speed of light delay, link capacity, mean queuing delay) per neighbour
+        self.link_table = {} # neighbour_id -> entry of links
+        self.mempool = Mempool(MAX_BLOCK_TXNS-1)
+        self.speed_of_light_delay=speed_of_light_delay # LinkLatencies shared by all peers
         self.hashing_power=hashing_power
         if (not is_low_cpu) and (not selfish_miner):
             self.hashing_power*=10
         self.mean_block_generation_time=mean_block_generation_time
-        self.file_writing_lines=['block_index,miner_id,block_id,num_of_txns,mine_time,arrival_time']
+        self.block_log=None # shared streaming writer of block arrivals, see blocklog.py
+        self.instrumentation=None # shared Instrumentation of the run, see profiler.py
+        self.streams=streams if streams is not None else RandomStreams() # random streams shared by all peers, see rng.py
+        self.event_queue=event_queue if event_queue is not None else HeapScheduler() # scheduler shared by all peers, see scheduler.py
+        self.compact_relay=False # relay blocks as compact blocks, see relay_block
+        self.pending_blocks=set() # ids of compact blocks waiting for their missing transactions
+        self.mining_block=None # block of the live blk_mining event, earlier ones are cancelled
 
         self.selfish_miner=selfish_miner
-        self.private_chain=Blockchain()
+        #Both chains are views of the shared block store, honest peers keep a single view for both
+        self.private_chain=Blockchain(block_store)
+        self.blockchain=Blockchain(self.private_chain.store) if selfish_miner else self.private_chain
     
+    #Function to precompute the latency parameters of the links to all neighbours
+    def build_link_table(self):
+        self.links=[]
+        for neighbour_id, neighbour_is_slow in self.neighbours:
+            if not self.is_slow and not neighbour_is_slow:
+                c=100000000
+            else:
+                c=5000000
+            self.links.append((neighbour_id, self.speed_of_light_delay.get(self.peer_id, neighbour_id), c, 96000/c))
+        self.link_table={link[0]: link for link in self.links}
+
+    #Function to schedule the arrival of a message of m bits at every neighbour
+    def send_to_neighbours(self, current_time, event_type, data, m):
+        #One draw for all queuing delays, equal to an exponential with mean 96000/c per link
+        queuing=self.streams.latency.standard_exponential(len(self.links)).tolist()
+        push=self.event_queue.push
+        for (neighbour_id, delay, c, queuing_mean), d in zip(self.links, queuing):
+            time_delta = delay + (m/c) + d*queuing_mean
+            push(new_event(current_time+time_delta, event_type, neighbour_id, data))
+
+    #Function to schedule the arrival of a message of m bits at one neighbour
+    def send_to(self, current_time, neighbour_id, event_type, data, m):
+        neighbour_id, delay, c, queuing_mean = self.link_table[neighbour_id]
+        time_delta = delay + (m/c) + self.streams.latency.standard_exponential()*queuing_mean
+        self.event_queue.push(new_event(current_time+time_delta, event_type, neighbour_id, data))
+
     #Function to handle transaction generation event
     def generate_transaction(self, current_time):
-        receiver_id=random.choice([peer_id for peer_id in self.all_peers if peer_id != self.peer_id])
-        amount = random.randint(0, 5)
+        #Uniform among all other peers, without building the list
+        random=self.streams.transactions.random
+        receiver_id=int(random()*(len(self.all_peers)-1))
+        if receiver_id >= self.peer_id:
+            receiver_id+=1
+        amount = int(random()*6)
         txn=Transaction(self.peer_id, receiver_id, amount)
         #calling receive transaction to it self
         self.receive_transaction(txn, current_time)
     
-    #Function to find transaction in the stored transactions
+    #Function to find transaction in the stored or already confirmed transactions
     def find_transactions(self, txn):
-        for transaction in self.transactions:
-            if(transaction.txn_id == txn.txn_id):
-                return True
-        return False
+        return self.mempool.seen(txn)
 
     #Function to handle receive transaction event
     def receive_transaction(self, txn, current_time):
         #To prevent transmitting same transactions
         #Implementation of Transaction Generation(Part 2)
         #Check to facilitate loopless transaction forwarding
-        if self.find_transactions(txn):
+        if not self.mempool.add(txn):
+            if self.instrumentation is not None:
+                self.instrumentation.duplicate_txns+=1
             return
-        self.transactions.append(txn)
         if self.selfish_miner:
             return
         #Simulating Latencies for transaction propagation
-        m = 1000*8
-        for neighbour in self.neighbours:
-            c=0
-            if not self.is_slow and not neighbour[1]:
-                c=100000000
-            else:
-                c=5000000
-            d = np.random.exponential(96000/c)
-            time_delta = self.speed_of_light_delay[self.peer_id][neighbour[0]] + (m/c) + d
-            new_event= Event(current_time+time_delta, 'txn_receive', neighbour[0], txn)
-            heapq.heappush(event_queue, new_event)
+        self.send_to_neighbours(current_time, TXN_RECEIVE, txn, 1000*8)
     
-    #Function to start generating block by a node
+    #Function to start generating block by a node.
+    #Mining restarts on every call, the blk_mining event of the previous call becomes a tombstone.
     def generate_block(self, current_time):
-        prev_hash=hash(self.blockchain.last_block)
-        index=self.blockchain.last_block.index+1
-        if self.selfish_miner:
-            prev_hash=hash(self.private_chain.last_block)
-            index=self.private_chain.last_block.index+1
-        new_block=Block(prev_hash, self.peer_id, index, self.blockchain.last_block.blk_id)
-        
-        i=0
-        while i < len(self.transactions) and len(new_block.transactions)<1000:
-            new_block.add_transaction(self.transactions[i])
-            i+=1
-        Tk = np.random.exponential(self.mean_block_generation_time/self.hashing_power)
-        mining = Event(current_time+Tk, 'blk_mining', self.peer_id, new_block)
-        heapq.heappush(event_queue, mining)
+        #Selfish miners extend their private chain, honest peers have a single chain
+        prev_block=self.private_chain.last_block
+        new_block=Block(hash(prev_block), self.peer_id, prev_block.index+1, prev_block.blk_id)
+        #The template holds the first MAX_BLOCK_TXNS-1 pending transactions, next to the coinbase
+        new_block.transactions.extend(self.mempool.block_template())
+        Tk = self.streams.mining.exponential(self.mean_block_generation_time/self.hashing_power)
+        mining = new_event(current_time+Tk, BLK_MINING, self.peer_id, new_block)
+        cancelled=self.mining_block is not None
+        #Replaced first, so that a compaction started by add_tombstone sees the old event as dead
+        self.mining_block=new_block
+        if cancelled:
+            self.event_queue.add_tombstone()
+            if self.instrumentation is not None:
+                self.instrumentation.cancelled_mining+=1
+        self.event_queue.push(mining)
+
+    #Function to tell a cancelled blk_mining event of this peer, see generate_block
+    def is_cancelled(self, block):
+        return block is not self.mining_block
 
     #Function to handle Block Mining event
     def mine_block(self, current_time, data):
         block = data
+        #Cancelled mining is skipped without any other work
+        if block is not self.mining_block:
+            self.event_queue.remove_tombstone()
+            if self.instrumentation is not None:
+                self.instrumentation.dead_mining+=1
+            return
+        self.mining_block=None
         block.mine_time=current_time
         if block.prev_blk_id!=self.private_chain.last_block.blk_id:
+            if self.instrumentation is not None:
+                self.instrumentation.stale_mining+=1
             self.generate_block(current_time)
         else:
             self.receive_block(current_time, block)
 
-    #Function to validate a block and return the balance after making all transactions (for honest miners only)
+    #Function to validate a block and return the ledger after making all transactions (for honest miners only)
     def validate_block(self, block):
-        if block.index-1 in self.private_chain.blocks:
-            prev_block=None
-            for blk in self.private_chain.blocks[block.index-1]:
-                if blk.blk_id == block.prev_blk_id:
-                    prev_block=blk
-                    if hash(blk) != block.prev_hash:
-                        print("Block getting rejected for hash", self.peer_id)
-                        return None
-            if not prev_block:
-                print("Block getting rejected", self.peer_id)
-                return None
+        prev_block=self.private_chain.find_block_by_id(block.prev_blk_id)
         #To invalidate receiving of future blocks
+        if not prev_block or prev_block.index != block.index-1:
+            return self.reject_block("Block getting rejected", 'unknown_parent')
+        if hash(prev_block) != block.prev_hash:
+            return self.reject_block("Block getting rejected for hash", 'hash_mismatch')
+        #Validating Transactions, only checked by the first peer that receives the block
+        ledger=self.private_chain.store.validate(block, prev_block)
+        if ledger is None and self.instrumentation is not None:
+            self.instrumentation.reject_block('negative_balance')
+        return ledger
+
+    #Function to report a rejected block, counted when the run is instrumented and printed otherwise
+    def reject_block(self, message, reason):
+        if self.instrumentation is not None:
+            self.instrumentation.reject_block(reason)
         else:
-            print("Block getting rejected", self.peer_id)
-            return None
-        #Validating Transactions
-        balance=prev_block.balance[:]
-        for txn in block.transactions:
-            if isinstance(txn, Coinbase):
-                balance[txn.miner]+=50
-            else:
-                balance[txn.sender]-=txn.amount
-                balance[txn.receiver]+=txn.amount
-        for i in balance:
-            if i < 0:
-                return None
-        
-        return balance
+            print(message, self.peer_id)
+        return None
 
     #Function handles receive block event only for honest miners
     def receive_block(self, current_time, block: Block):
@@ -135,71 +170,58 @@ class Peer:
             return
         if block.miner_id!=-1:
             #Check to facilitate loopless block forwarding
-            if block.index in self.private_chain.blocks:
-                for blk in self.private_chain.blocks[block.index]:
-                    if blk.blk_id == block.blk_id:
-                        return
-            balance=self.validate_block(block)
-            if not balance:
+            if self.private_chain.has_block(block.blk_id):
+                if self.instrumentation is not None:
+                    self.instrumentation.duplicate_blocks+=1
+                return
+            ledger=self.validate_block(block)
+            if not ledger:
                 return
-            block.balance=balance
             self.blockchain.add_block(block)
             self.private_chain.add_block(block)
             for txn in block.transactions:
-                if txn in self.transactions:
-                    self.transactions.remove(txn)
-                self.used_txns.append(txn)
-        elif len(self.blockchain.blocks[0])>0:
+                self.mempool.confirm(txn)
+        elif self.blockchain.last_block is not None:
             return
         else:
             self.blockchain.add_genesis(block)
             self.private_chain.add_genesis(block)
         self.add_to_file_writing(block.index, block.miner_id, block.blk_id, len(block.transactions), block.mine_time, current_time)
        
-        m=len(block.transactions)*1000*8
-        for neighbour in self.neighbours:
-            c=0
-            if not self.is_slow and not neighbour[1]:
-                c=100000000
-            else:
-                c=5000000
-            d = np.random.exponential(96000/c)
-            time_delta = self.speed_of_light_delay[self.peer_id][neighbour[0]] + (m/c) + d
-            new_event=Event(current_time+time_delta, 'blk_receive', neighbour[0], block)
-            heapq.heappush(event_queue, new_event)
+        self.relay_block(current_time, block)
         if block == self.private_chain.last_block:
             self.generate_block(current_time)
     
     #Function for storing logs on each block receive
     def add_to_file_writing(self,block_index,miner_id,block_id,num_of_txns,mine_time,arrival_time):
-        self.file_writing_lines.append(f'\n{block_index},{miner_id},{block_id},{num_of_txns},{mine_time},{arrival_time}') 
+        if self.block_log is not None:
+            self.block_log.record(self.peer_id,block_index,miner_id,block_id,num_of_txns,mine_time,arrival_time)
 
     #Selfish Miner Receive Block
     def selfish_miner_receive_block(self, current_time, block):
         if block.miner_id == -1:
-            if len(self.private_chain.blocks[0])>0:
+            if self.private_chain.last_block is not None:
                 return
             else:
                 self.blockchain.add_genesis(block)
                 self.private_chain.add_genesis(block)
+                self.add_to_file_writing(block.index, block.miner_id, block.blk_id, len(block.transactions), block.mine_time, current_time)
                 self.generate_block(current_time)
         else:
-            if block.index in self.private_chain.blocks:
-                for blk in self.private_chain.blocks[block.index]:
-                    if blk.blk_id == block.blk_id:
-                        return
-            balance=self.validate_block(block)
-            if not balance:
+            if self.private_chain.has_block(block.blk_id):
+                if self.instrumentation is not None:
+                    self.instrumentation.duplicate_blocks+=1
+                return
+            ledger=self.validate_block(block)
+            if not ledger:
                 return
-            block.balance=balance
             for txn in block.transactions:
-                if txn in self.transactions:
-                    self.transactions.remove(txn)
-                self.used_txns.append(txn)
+                self.mempool.confirm(txn)
+            self.add_to_file_writing(block.index, block.miner_id, block.blk_id, len(block.transactions), block.mine_time, current_time)
             if block.miner_id == self.peer_id:
                 self.private_chain.add_block(block)
                 if self.private_chain.last_block.index == self.blockchain.last_block.index-1:
-                    self.broadcast_block(self.private_chain.last_block)
+                    self.broadcast_block(current_time, self.private_chain.last_block)
                 self.generate_block(current_time)
             elif self.blockchain.last_block.index >= self.private_chain.last_block.index:
                 self.private_chain.add_block(block)
@@ -218,27 +240,60 @@ class Peer:
                 self.generate_block(current_time)
             else:
                 parallelblock=None
-                for blk in self.private_chain.blocks[block.index]:
+                for blk in self.private_chain.blocks_at(block.index):
                     if blk.miner_id == self.peer_id:
                         parallelblock=blk
                         break
-                self.broadcast_block(current_time, parallelblock)
+                #A block from below the private fork has no counterpart to release
+                if parallelblock is not None:
+                    self.broadcast_block(current_time, parallelblock)
                 self.private_chain.add_block(block)
                 self.blockchain.add_block(block)
             
     def broadcast_block(self, current_time, block: Block):
         self.blockchain.add_block(block)
-        m = len(block.transactions)*1000*8
-        for neighbour in self.neighbours:
-            c=0
-            if not self.is_slow and not neighbour[1]:
-                c=100000000
-            else:
-                c=5000000
-            d = np.random.exponential(96000/c)
-            time_delta = self.speed_of_light_delay[self.peer_id][neighbour[0]] + (m/c) + d
-            new_event=Event(current_time+time_delta, 'blk_receive', neighbour[0], block)
-            heapq.heappush(event_queue, new_event)
+        self.relay_block(current_time, block)
+
+    #Function to send a block to all neighbours, in full or as a compact block.
+    #A compact block carries the header, the coinbase and a short id per transaction, the receiver
+    #fetches the transactions missing from its mempool from the sender (see receive_compact_block).
+    def relay_block(self, current_time, block: Block):
+        if self.compact_relay:
+            m=HEADER_BITS+TXN_BITS+SHORT_ID_BITS*(len(block.transactions)-1)
+            self.send_to_neighbours(current_time, BLK_ANNOUNCE, (block, self.peer_id), m)
+        else:
+            self.send_to_neighbours(current_time, BLK_RECEIVE, block, len(block.transactions)*TXN_BITS)
+
+    #Function to handle a compact block from a neighbour, it is received at once if the mempool
+    #holds all its transactions and otherwise after a request and response for the missing ones
+    def receive_compact_block(self, current_time, data):
+        block, sender_id = data
+        if self.private_chain.has_block(block.blk_id) or block.blk_id in self.pending_blocks:
+            if self.instrumentation is not None:
+                self.instrumentation.duplicate_blocks+=1
+            return
+        missing=self.mempool.missing(block.transactions[1:])
+        if not missing:
+            if self.instrumentation is not None:
+                self.instrumentation.compact_reconstructed+=1
+            self.receive_block(current_time, block)
+            return
+        if self.instrumentation is not None:
+            self.instrumentation.blktxn_requests+=1
+            self.instrumentation.blktxn_fetched+=len(missing)
+        self.pending_blocks.add(block.blk_id)
+        self.send_to(current_time, sender_id, BLKTXN_REQUEST, (block, self.peer_id, missing), SHORT_ID_BITS*len(missing))
+
+    #Function to answer a request for the missing transactions of a compact block
+    def send_block_transactions(self, current_time, data):
+        block, requester_id, missing = data
+        self.send_to(current_time, requester_id, BLKTXN_RESPONSE, (block, missing), TXN_BITS*len(missing))
+
+    #Function to complete a compact block once its missing transactions arrived
+    def receive_block_transactions(self, current_time, data):
+        block, missing = data
+        self.pending_blocks.discard(block.blk_id)
+        self.receive_block(current_time, block)
 
 
         
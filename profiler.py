@@ -0,0 +1,98 @@
+import hashlib
+import json
+import struct
+import time
+
+from event import EVENT_NAMES
+
+#Optional instrumentation of a simulation run: count and wall time per event type, depth of the event
+#queue over time and counters of work the peers throw away. Peers and the event loop only touch it
+#when it is attached, so a run without it pays nothing beyond a None check.
+class Instrumentation:
+    def __init__(self, report_interval=None, sample_every=1000):
+        self.report_interval=report_interval # simulated seconds between progress lines, None for none
+        self.sample_every=sample_every # events between two samples of the queue depth
+        self.counts=[0]*len(EVENT_NAMES)
+        self.seconds=[0.0]*len(EVENT_NAMES)
+        self.queue_depth=[] # (simulated time, events in the queue)
+        self.max_queue_depth=0
+        self.stale_mining=0 # live blk_mining events whose parent was no longer the tip
+        self.cancelled_mining=0 # blk_mining events cancelled by a new start of mining
+        self.dead_mining=0 # cancelled blk_mining events skipped when popped
+        self.compacted=0 # cancelled events removed by compacting the event queue, filled in at the end of the run
+        self.duplicate_txns=0 # transactions dropped by loopless forwarding
+        self.duplicate_blocks=0 # blocks dropped by loopless forwarding
+        self.rejected_blocks={} # reason -> count
+        self.compact_reconstructed=0 # compact blocks completed from the mempool alone
+        self.blktxn_requests=0 # compact blocks that needed a request for missing transactions
+        self.blktxn_fetched=0 # transactions fetched by those requests
+        self.processed=0
+        self.next_report=report_interval
+        self.started=time.perf_counter()
+
+    #Called by the event loop after each event
+    def event_done(self, event_type, seconds, current_time, queue_depth):
+        self.counts[event_type]+=1
+        self.seconds[event_type]+=seconds
+        self.processed+=1
+        if queue_depth > self.max_queue_depth:
+            self.max_queue_depth=queue_depth
+        if self.processed % self.sample_every == 0:
+            self.queue_depth.append((current_time, queue_depth))
+        if self.next_report is not None and current_time >= self.next_report:
+            self.next_report=(current_time//self.report_interval+1)*self.report_interval
+            print(self.progress_line(current_time, queue_depth))
+
+    def reject_block(self, reason):
+        self.rejected_blocks[reason]=self.rejected_blocks.get(reason, 0)+1
+
+    def progress_line(self, current_time, queue_depth):
+        elapsed=time.perf_counter()-self.started
+        return (f"t={current_time:.1f} events={self.processed} queue={queue_depth} events/sec={self.processed/elapsed:.0f} "
+                f"cancelled_mining={self.cancelled_mining} stale_mining={self.stale_mining} duplicate_blocks={self.duplicate_blocks} rejected_blocks={sum(self.rejected_blocks.values())}")
+
+    def report(self):
+        return {
+            'events': {name: {'count': self.counts[code], 'seconds': self.seconds[code],
+                              'mean_us': 1e6*self.seconds[code]/self.counts[code] if self.counts[code] else 0.0}
+                       for code, name in enumerate(EVENT_NAMES)},
+            'processed': self.processed,
+            'wall_seconds': time.perf_counter()-self.started,
+            'max_queue_depth': self.max_queue_depth,
+            'queue_depth': self.queue_depth,
+            'stale_mining': self.stale_mining,
+            'cancelled_mining': self.cancelled_mining,
+            'dead_mining_skipped': self.dead_mining,
+            'dead_mining_compacted': self.compacted,
+            'duplicate_txns': self.duplicate_txns,
+            'duplicate_blocks': self.duplicate_blocks,
+            'rejected_blocks': self.rejected_blocks,
+            'compact_reconstructed': self.compact_reconstructed,
+            'blktxn_requests': self.blktxn_requests,
+            'blktxn_fetched': self.blktxn_fetched,
+        }
+
+    def write_report(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+#Digest of the sequence of processed events: time, type, peer and the id of the block or transaction carried.
+#Two runs with the same seed and parameters give the same digest, unless an optimization changed which
+#events happen, when, or in which order. Ids count from the start of the simulation (see build_simulation).
+class TraceHash:
+    def __init__(self):
+        self.digest=hashlib.sha256()
+        self.events=0
+
+    #Called by the event loop before each event
+    def event(self, current_time, event_type, peer_id, data):
+        if type(data) is tuple:
+            data=data[0]
+        data_id=getattr(data, 'blk_id', None)
+        if data_id is None:
+            data_id=getattr(data, 'txn_id', -1)
+        self.digest.update(struct.pack('<dbiq', current_time, event_type, peer_id, data_id))
+        self.events+=1
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
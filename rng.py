@@ -0,0 +1,24 @@
+import numpy as np
+
+#Subsystems with a random stream of their own
+STREAMS=['topology', 'latency', 'transactions', 'mining', 'render']
+
+#Independent numpy Generators, one per subsystem, all derived from one seed.
+#A change in how often one subsystem draws does not shift the numbers seen by the others,
+#so two runs with the same seed can be compared event for event.
+class RandomStreams:
+    def __init__(self, seed=None):
+        if seed is None:
+            seed=int(np.random.SeedSequence().entropy % 2**63)
+        self.seed=seed
+        self.reseed(seed)
+
+    #Function to restart every stream from a new seed, in place so that holders of a generator see the change
+    def reseed(self, seed):
+        self.seed=seed
+        for name, child in zip(STREAMS, np.random.SeedSequence(seed).spawn(len(STREAMS))):
+            generator=np.random.default_rng(child)
+            if hasattr(self, name):
+                getattr(self, name).bit_generator.state=generator.bit_generator.state
+            else:
+                setattr(self, name, generator)
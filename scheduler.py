@@ -0,0 +1,170 @@
+import heapq
+from functools import partial
+
+#Schedulers hold the pending events of a simulation, ordered by (event_time, seq), see event.py.
+#Every scheduler has push(event), pop() which raises IndexError when empty, __len__, clear() and events().
+
+#Cancelled events are not searched for in the queue, they stay as tombstones and their handler skips
+#them when they are popped. Owners report cancellations with add_tombstone and skipped tombstones with
+#remove_tombstone. Once tombstones are at least min_compaction and more than half of the queue, every
+#event for which is_dead (set by the simulation) holds is removed at once.
+class Scheduler:
+    min_compaction=1024
+
+    def __init__(self):
+        self.tombstones=0
+        self.is_dead=None
+        self.compacted=0 # dead events removed by compaction
+
+    def add_tombstone(self):
+        self.tombstones+=1
+        if self.tombstones >= self.min_compaction and 2*self.tombstones > len(self) and self.is_dead is not None:
+            self.compacted+=self.remove_dead(self.is_dead)
+            self.tombstones=0
+
+    def remove_tombstone(self):
+        self.tombstones-=1
+
+#Binary heap of all pending events, push and pop are the C functions of heapq bound to the list
+class HeapScheduler(Scheduler):
+    def __init__(self):
+        super().__init__()
+        self.queue=[]
+        self.push=partial(heapq.heappush, self.queue)
+        self.pop=partial(heapq.heappop, self.queue)
+
+    def __len__(self):
+        return len(self.queue)
+
+    def clear(self):
+        self.queue.clear()
+        self.tombstones=0
+
+    #Function to get all pending events, in no particular order
+    def events(self):
+        return list(self.queue)
+
+    #Function to drop the events for which is_dead holds, returns how many were dropped
+    def remove_dead(self, is_dead):
+        size=len(self.queue)
+        #In place, push and pop are bound to this list
+        self.queue[:]=[event for event in self.queue if not is_dead(event)]
+        heapq.heapify(self.queue)
+        return size-len(self.queue)
+
+#Calendar queue with buckets of bucket_width simulated seconds.
+#Only the earliest bucket is kept as a small heap, later events are appended unsorted to the bucket of
+#their time and a bucket is heapified when it becomes the earliest, so most pushes are O(1) and pops
+#work on a heap of one bucket instead of all pending events. Empty buckets cost nothing, as buckets
+#live in a dict and only the keys of the non-empty ones are kept in order. The width is adapted to
+#the density of events every adapt_every buckets, aiming at about target_size events per bucket.
+class CalendarScheduler(Scheduler):
+    def __init__(self, bucket_width=0.05, target_size=32, adapt_every=64):
+        super().__init__()
+        self.bucket_width=bucket_width
+        self.inverse_width=1/bucket_width
+        self.target_size=target_size
+        self.adapt_every=adapt_every
+        self.current=[] # heap of the events of the earliest bucket
+        self.current_key=-1 # key of that bucket, events with a key up to it go into current
+        self.buckets={} # key -> unsorted events of a later bucket
+        self.keys=[] # heap of the keys in buckets
+        self.size=0
+        self.loaded_buckets=0
+        self.loaded_events=0
+        self.window_start=None # time of the first bucket loaded since the width was last checked
+
+    def __len__(self):
+        return self.size
+
+    def push(self, event):
+        self.size+=1
+        key=int(event[0]*self.inverse_width)
+        if key <= self.current_key:
+            heapq.heappush(self.current, event)
+            return
+        bucket=self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key]=[event]
+            heapq.heappush(self.keys, key)
+        else:
+            bucket.append(event)
+
+    def pop(self):
+        if not self.current:
+            self.load_next_bucket()
+        event=heapq.heappop(self.current)
+        self.size-=1
+        return event
+
+    #Function to make the earliest non-empty bucket the current one, raises IndexError when there is none
+    def load_next_bucket(self):
+        key=heapq.heappop(self.keys)
+        current=self.buckets.pop(key)
+        #A sorted list is a valid heap
+        current.sort()
+        self.current=current
+        self.current_key=key
+        if self.window_start is None:
+            self.window_start=key*self.bucket_width
+        self.loaded_buckets+=1
+        self.loaded_events+=len(current)
+        if self.loaded_buckets >= self.adapt_every:
+            self.adapt_width()
+
+    #Function to rescale the buckets when they hold far more or far fewer events than target_size.
+    #The new width is the time in which target_size events were popped, at the rate of the last buckets.
+    def adapt_width(self):
+        mean_size=self.loaded_events/self.loaded_buckets
+        span=(self.current_key+1)*self.bucket_width-self.window_start
+        loaded=self.loaded_events
+        self.loaded_buckets=0
+        self.loaded_events=0
+        self.window_start=None
+        if self.target_size/4 <= mean_size <= self.target_size*4:
+            return
+        width=max(span*self.target_size/loaded, 1e-9)
+        events=[event for bucket in self.buckets.values() for event in bucket]
+        self.bucket_width=width
+        self.inverse_width=1/width
+        #The current bucket stays as it is, its events are all earlier than those of the later buckets
+        #and it takes new events up to the end of its last event's bucket in the new width
+        self.current_key=int(max(self.current)[0]*self.inverse_width) if self.current else -1
+        self.buckets={}
+        self.keys=[]
+        self.size-=len(events)
+        for event in events:
+            self.push(event)
+
+    def clear(self):
+        self.current=[]
+        self.current_key=-1
+        self.buckets={}
+        self.keys=[]
+        self.size=0
+        self.loaded_buckets=0
+        self.loaded_events=0
+        self.window_start=None
+        self.tombstones=0
+
+    #Function to get all pending events, in no particular order
+    def events(self):
+        return self.current+[event for bucket in self.buckets.values() for event in bucket]
+
+    #Function to drop the events for which is_dead holds, returns how many were dropped
+    def remove_dead(self, is_dead):
+        size=self.size
+        self.current=[event for event in self.current if not is_dead(event)]
+        heapq.heapify(self.current)
+        for key in list(self.buckets):
+            bucket=[event for event in self.buckets[key] if not is_dead(event)]
+            if bucket:
+                self.buckets[key]=bucket
+            else:
+                del self.buckets[key]
+        self.keys=list(self.buckets)
+        heapq.heapify(self.keys)
+        self.size=len(self.current)+sum(len(bucket) for bucket in self.buckets.values())
+        return size-self.size
+
+SCHEDULERS={'heap': HeapScheduler, 'calendar': CalendarScheduler}
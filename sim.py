@@ -1,40 +1,187 @@
 #Assignment 2
 # Created by Sayantan Biswas & Shamik Kumar De
 
-import random
+import argparse
+import json
+import os
+import time
+import shutil
 import numpy as np
 import networkx as nx
-import heapq
 import sys
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 
-from event import Event
+from event import new_event, TXN_GENERATION, TXN_RECEIVE, BLK_GENERATION, BLK_MINING, BLK_RECEIVE, BLK_ANNOUNCE, BLKTXN_REQUEST, BLKTXN_RESPONSE, EVENT_NAMES
 from peer import Peer
-from peer import event_queue
 from block import Block
+from ledger import Ledger
+from blockchain import BlockStore
+from metrics import ChainMetrics
+from profiler import Instrumentation, TraceHash
+from checkpoint import save_checkpoint, load_checkpoint, reset_counters
+from latency import LinkLatencies
+from rng import RandomStreams
+from scheduler import SCHEDULERS
+from blocklog import LOG_FORMATS
 
+#Handlers for each event code, called as handler(peer, current_time, data)
+def handle_txn_generation(peer, current_time, data):
+    peer.generate_transaction(current_time)
+    data.schedule_next(current_time)
+
+def handle_txn_receive(peer, current_time, data):
+    peer.receive_transaction(data, current_time)
+
+def handle_blk_generation(peer, current_time, data):
+    peer.generate_block(current_time)
+
+def handle_blk_mining(peer, current_time, data):
+    peer.mine_block(current_time, data)
+
+def handle_blk_receive(peer, current_time, data):
+    peer.receive_block(current_time, data)
+
+def handle_blk_announce(peer, current_time, data):
+    peer.receive_compact_block(current_time, data)
+
+def handle_blktxn_request(peer, current_time, data):
+    peer.send_block_transactions(current_time, data)
+
+def handle_blktxn_response(peer, current_time, data):
+    peer.receive_block_transactions(current_time, data)
+
+def skip_event(peer, current_time, data):
+    pass
+
+#Dispatch table used while the simulation is running, indexed by event code
+EVENT_HANDLERS=[None]*len(EVENT_NAMES)
+EVENT_HANDLERS[TXN_GENERATION]=handle_txn_generation
+EVENT_HANDLERS[TXN_RECEIVE]=handle_txn_receive
+EVENT_HANDLERS[BLK_GENERATION]=handle_blk_generation
+EVENT_HANDLERS[BLK_MINING]=handle_blk_mining
+EVENT_HANDLERS[BLK_RECEIVE]=handle_blk_receive
+EVENT_HANDLERS[BLK_ANNOUNCE]=handle_blk_announce
+EVENT_HANDLERS[BLKTXN_REQUEST]=handle_blktxn_request
+EVENT_HANDLERS[BLKTXN_RESPONSE]=handle_blktxn_response
+
+#Dispatch table used after the simulation duration, only pending blocks are still delivered
+DRAIN_HANDLERS=[skip_event]*len(EVENT_NAMES)
+DRAIN_HANDLERS[BLK_RECEIVE]=handle_blk_receive
+DRAIN_HANDLERS[BLK_ANNOUNCE]=handle_blk_announce
+DRAIN_HANDLERS[BLKTXN_REQUEST]=handle_blktxn_request
+DRAIN_HANDLERS[BLKTXN_RESPONSE]=handle_blktxn_response
+
+
+#Function to draw a block tree snapshot (see Simulation.tree_snapshot) into filename.
+#It only uses plain data so it can run in a worker process.
+def render_tree(snapshot, filename):
+    blocks, num_peers, text = snapshot
+    G = nx.DiGraph()
+    plt.figure(figsize=(5,10))
+    levels = {}
+    node_colors = []
+    for index, blk_id, prev_blk_id, miner_id in blocks:
+        G.add_node(blk_id, label=f"{index}")
+        if index not in levels:
+            levels[index] = []
+        levels[index].append(blk_id)
+        if miner_id >= num_peers:
+            node_colors.append('red' if miner_id == num_peers else 'blue')
+        else:
+            node_colors.append('skyblue')
+
+    for index, blk_id, prev_blk_id, miner_id in blocks:
+        if prev_blk_id != -1:
+            G.add_edge(prev_blk_id, blk_id)
+
+    # Position nodes from top to bottom, equidistant horizontally
+    pos = {}
+    x_spacing = 0.1
+    y_spacing = 2
+    for level, nodes in levels.items():
+        y = -level * y_spacing
+        for i, node in enumerate(nodes):
+            pos[node] = (i * x_spacing, y)
+
+    # Draw the graph
+    labels = nx.get_node_attributes(G, 'label')
+    nx.draw(G, pos, with_labels=True, labels=labels, node_size=100, node_color=node_colors, font_size=3, node_shape='s')
+    plt.text(0,0, text, fontsize=13, color='black')
+    plt.title("Blockchain Visualization")
+    plt.savefig(filename)
+    plt.close()
+
+#Poisson process of transaction generation, streamed one arrival at a time.
+#Arrival times and peers come from the transactions stream of the simulation.
+#Transactions are generated by the given peers, all honest peers by default.
+#The process ends at the current duration of the simulation, which a resumed run may have extended.
+class TransactionArrivals:
+    def __init__(self, simulation, mean_transaction_time, peers=None):
+        self.simulation=simulation
+        self.mean_transaction_time=mean_transaction_time
+        self.peers=peers if peers is not None else simulation.peers
+        self.rng=simulation.streams.transactions
+
+    #Function to queue a txn_generation event for a randomly chosen peer
+    def schedule(self, event_time):
+        peers=self.peers
+        peer = peers[int(self.rng.random()*len(peers))]
+        self.simulation.schedule_event(event_time, TXN_GENERATION, peer.peer_id, self)
+
+    #Function to queue the arrival following the one at current_time
+    def schedule_next(self, current_time):
+        event_time=current_time+self.rng.exponential(self.mean_transaction_time)
+        if event_time<= self.simulation.simulation_duration:
+            self.schedule(event_time)
 
 class Simulation:
     # Function to initialize the simulation environment with the specified number of peers,
     # percentages of slow and low-CPU peers, and simulation duration.
-    def __init__(self, num_peers, slow_percentage, low_cpu_percentage, simulation_duration):
+    # Every random draw of the run comes from streams derived from seed, a random seed if None.
+    # Pending events are kept by the scheduler of the given name, see scheduler.py.
+    def __init__(self, num_peers, slow_percentage, low_cpu_percentage, simulation_duration, seed=None, scheduler='heap'):
         self.peers= []
         self.selfish_miners= []
-        self.graph= nx.Graph()
+        self.peer_table= [] # all peers indexed by peer_id
+        self.adjacency_offsets= None # compact adjacency arrays, see generate_random_topology
+        self.adjacency= None
         self.num_peers=num_peers
         self.simulation_duration = simulation_duration
         self.slow_percentage = slow_percentage
         self.low_cpu_percentage = low_cpu_percentage
         self.blockchain_data = {} # 
+        self.block_log = None
+        self.speed_of_light_delay = None
+        self.block_store = BlockStore() # every block once, peers keep views of it
+        self.metrics = None
+        self.summary_path = None # where run_simulation writes its JSON summary
+        self.instrumentation = None # optional Instrumentation, see instrument()
+        self.profile_path = None
+        self.current_time = 0.0 # time of the last processed event
+        self.checkpoint_interval = None # see enable_checkpoints()
+        self.checkpoint_dir = None
+        self.next_checkpoint = None
+        self.streams = RandomStreams(seed)
+        self.event_queue = SCHEDULERS[scheduler]()
+        self.event_queue.is_dead = self.is_dead_event
+        self.trace = None # optional TraceHash of the processed events, see enable_trace_hash()
+        self.arrivals = None # TransactionArrivals of the run
+        self.log_offsets = None # sizes of the block log files at the last checkpoint
+        self.log_directory = None # absolute path of the block log directory
 
 
     #Initiliazing Peers
     def initialize_peers(self, speed_of_light_delay, mean_block_generation_time, hashing_power1, hashing_power2):
+        self.speed_of_light_delay=speed_of_light_delay
         #Randomly selecting peers to be slow and have low cpu
         slow=[0]*self.num_peers
         low_cpu=[0]*self.num_peers
-        indices1 = random.sample(range(self.num_peers), int(self.num_peers * self.slow_percentage/ 100))
-        indices2 = random.sample(range(self.num_peers), int(self.num_peers * self.low_cpu_percentage / 100))
+        rng=self.streams.topology
+        indices1 = rng.choice(self.num_peers, int(self.num_peers * self.slow_percentage/ 100), replace=False).tolist()
+        indices2 = rng.choice(self.num_peers, int(self.num_peers * self.low_cpu_percentage / 100), replace=False).tolist()
         num_low_cpu=sum(low_cpu)
         num_high_cpu=self.num_peers-num_low_cpu
         #Determing Hashing Power
@@ -46,59 +193,131 @@ class Simulation:
         
         #Creating Peers
         for i in range(0, self.num_peers):
-            peer = Peer(i, slow[i], low_cpu[i], speed_of_light_delay, hashing_power, mean_block_generation_time, self.num_peers+2)
+            peer = Peer(i, slow[i], low_cpu[i], speed_of_light_delay, hashing_power, mean_block_generation_time, self.num_peers+2, block_store=self.block_store, streams=self.streams, event_queue=self.event_queue)
             self.peers.append(peer)
 
         #Creating Selfish miners
-        miner1= Peer(self.num_peers, 0, 0, speed_of_light_delay, hashing_power1/100, mean_block_generation_time, self.num_peers+2, True)
-        miner2= Peer(self.num_peers+1, 0, 0, speed_of_light_delay, hashing_power2/100, mean_block_generation_time, self.num_peers+2, True)
+        miner1= Peer(self.num_peers, 0, 0, speed_of_light_delay, hashing_power1/100, mean_block_generation_time, self.num_peers+2, True, self.block_store, self.streams, self.event_queue)
+        miner2= Peer(self.num_peers+1, 0, 0, speed_of_light_delay, hashing_power2/100, mean_block_generation_time, self.num_peers+2, True, self.block_store, self.streams, self.event_queue)
         self.selfish_miners=[miner1, miner2]
+        self.peer_table=self.peers+self.selfish_miners
+        #MPU is measured on the main chain seen by an honest peer
+        self.metrics=ChainMetrics(self.block_store, [miner1.peer_id, miner2.peer_id])
+        self.block_store.metrics=self.metrics
+        self.peers[0].private_chain.metrics=self.metrics
 
         
     # Function to generate a random network topology by adding nodes corresponding to peers,
     # and connecting them randomly with a degree between 3 and 6.
-    def generate_random_topology(self):
-        self.graph.add_nodes_from(self.peers+self.selfish_miners)
-        for peer in self.peers+self.selfish_miners:
-            num_connections = random.randint(3,6) - self.graph.degree[peer]
-            num_connections = max(0, num_connections)
-            peers_to_connect = random.sample([other_peer for other_peer in self.peers+self.selfish_miners if other_peer != peer and peer not in other_peer.neighbours and len(other_peer.neighbours)<6], num_connections)
-            self.graph.add_edges_from([(peer, connected_peer) for connected_peer in peers_to_connect])
-            for connected_peer in peers_to_connect:
-                peer.neighbours.append((connected_peer.peer_id, connected_peer.is_slow))
-                connected_peer.neighbours.append((peer.peer_id, peer.is_slow))
-        
-        for peer in self.peers+self.selfish_miners:
-            print(peer.peer_id, peer. neighbours)
+    # The graph is connected by construction: a random spanning tree is built first, then random
+    # links are added towards a target degree per peer. Runs in O(n*d).
+    def generate_random_topology(self, min_degree=3, max_degree=6):
+        n=len(self.peer_table)
+        rng=self.streams.topology
+        adjacency=[[] for _ in range(n)]
+        #Peers that can still take a link, with their position for O(1) removal
+        open_peers=[]
+        position=[-1]*n
+
+        def connect(a, b):
+            adjacency[a].append(b)
+            adjacency[b].append(a)
+            for peer_id in (a, b):
+                if len(adjacency[peer_id]) == max_degree and position[peer_id] >= 0:
+                    last=open_peers.pop()
+                    if last != peer_id:
+                        open_peers[position[peer_id]]=last
+                        position[last]=position[peer_id]
+                    position[peer_id]=-1
+
+        def can_connect(a, b):
+            return a != b and len(adjacency[a]) < max_degree and len(adjacency[b]) < max_degree and b not in adjacency[a]
+
+        #Random spanning tree, each peer links to a random earlier peer with a free slot
+        for peer_id in rng.permutation(n).tolist():
+            if open_peers:
+                connect(peer_id, open_peers[int(rng.random()*len(open_peers))])
+            if len(adjacency[peer_id]) < max_degree:
+                position[peer_id]=len(open_peers)
+                open_peers.append(peer_id)
+
+        #Random links towards the target degree of each peer, by pairing up free slots
+        target=rng.integers(min_degree, max_degree+1, size=n).tolist()
+        slots=[]
+        for peer_id in range(n):
+            slots.extend([peer_id]*(target[peer_id]-len(adjacency[peer_id])))
+        slots=rng.permutation(slots).tolist()
+        for i in range(0, len(slots)-1, 2):
+            if can_connect(slots[i], slots[i+1]):
+                connect(slots[i], slots[i+1])
+
+        #Peers still below the minimum degree link to random peers with a free slot
+        for peer_id in range(n):
+            attempts=0
+            while len(adjacency[peer_id]) < min_degree and len(open_peers) > 1 and attempts < 100:
+                other=open_peers[int(rng.random()*len(open_peers))]
+                if can_connect(peer_id, other):
+                    connect(peer_id, other)
+                attempts+=1
+
+        #Compact adjacency: neighbours of peer i are adjacency[adjacency_offsets[i]:adjacency_offsets[i+1]]
+        self.adjacency_offsets=np.zeros(n+1, dtype=np.int64)
+        self.adjacency_offsets[1:]=np.cumsum([len(neighbours) for neighbours in adjacency])
+        self.adjacency=np.fromiter((neighbour for neighbours in adjacency for neighbour in neighbours), dtype=np.int32, count=int(self.adjacency_offsets[-1]))
+
+        for peer in self.peer_table:
+            peer.neighbours=[(neighbour, self.peer_table[neighbour].is_slow) for neighbour in adjacency[peer.peer_id]]
+            peer.build_link_table()
     
-    #Function to check for graph being connected or not
+    #Function to check for graph being connected or not, by a search over the adjacency arrays
     def is_connected_graph(self):
-        return nx.is_connected(self.graph)
+        n=len(self.peer_table)
+        seen=np.zeros(n, dtype=bool)
+        seen[0]=True
+        stack=[0]
+        while stack:
+            peer_id=stack.pop()
+            for neighbour in self.adjacency[self.adjacency_offsets[peer_id]:self.adjacency_offsets[peer_id+1]].tolist():
+                if not seen[neighbour]:
+                    seen[neighbour]=True
+                    stack.append(neighbour)
+        return bool(seen.all())
 
     def recreate_graph(self):
-        for peer in self.peers+self.selfish_miners:
-            peer.neighbours=[]
+        self.speed_of_light_delay.clear()
         self.generate_random_topology()
 
-    def schedule_event(self, event_time, event_type, peer_id):
-        event=Event(event_time, event_type, peer_id)
-        heapq.heappush(event_queue, event)
+    #Function to build a networkx graph of the network for analysis or drawing
+    def network_graph(self):
+        graph=nx.Graph()
+        graph.add_nodes_from(range(len(self.peer_table)))
+        for peer_id in range(len(self.peer_table)):
+            for neighbour in self.adjacency[self.adjacency_offsets[peer_id]:self.adjacency_offsets[peer_id+1]].tolist():
+                if peer_id < neighbour:
+                    graph.add_edge(peer_id, neighbour)
+        return graph
+
+    #Function to tell a tombstone in the event queue, a blk_mining event cancelled by its peer
+    def is_dead_event(self, event):
+        return event[2] == BLK_MINING and self.peer_table[event[3]].is_cancelled(event[4])
+
+    def schedule_event(self, event_time, event_type, peer_id, data=None):
+        event=new_event(event_time, event_type, peer_id, data)
+        self.event_queue.push(event)
     #Function to initialize events
-    def initialize_events(self, simulation_duration, mean_transaction_time):
+    def initialize_events(self, mean_transaction_time):
         #Implementation of Transaction Generation(Part1) --- Part2 in peer.py
-        event_time=0.0
-        while event_time<= simulation_duration:
-            peer = random.choice([node for node in self.peers])
-            self.schedule_event(event_time, 'txn_generation', peer.peer_id)
-            event_time+=np.random.exponential(mean_transaction_time)
+        #Only the first arrival is queued, each txn_generation event schedules the next one
+        self.arrivals=TransactionArrivals(self, mean_transaction_time)
+        self.arrivals.schedule(0.0)
             
    #Function for Scheduling the event of creating genesis block and then receiving by a peer
     def genesis_block_receive(self):
         genesis=Block(0, -1, 0, -1)
-        genesis.balance=[50]*(self.num_peers+2)
+        genesis.ledger=Ledger(checkpoint=[50]*(self.num_peers+2))
         for i in range(self.num_peers+2):
-            genesis_event = Event(0, 'blk_receive', i, genesis)
-            heapq.heappush(event_queue, genesis_event)
+            genesis_event = new_event(0, BLK_RECEIVE, i, genesis)
+            self.event_queue.push(genesis_event)
     
     def display_network(self):
         node_color=['skyblue']*self.num_peers
@@ -111,130 +330,208 @@ class Simulation:
         plt.close()
 
     def find_peer_by_id(self, id):
-        for peer in self.peers+self.selfish_miners:
-            if peer.peer_id == id:
-                return peer
+        if 0 <= id < len(self.peer_table):
+            return self.peer_table[id]
         return None
     
     # Function to Run the simulation for the specified duration, processing events from the event queue.
+    # With a checkpoint interval the state is saved every checkpoint_interval simulated seconds.
+    # Returns the number of events processed.
     def run_simulation(self, simulation_duration):
-        current_time=0.0
-        while current_time <= self.simulation_duration and event_queue:
-            current_event = heapq.heappop(event_queue)
-            current_time = current_event.event_time
-
-            peer = self.find_peer_by_id(current_event.peer_id)
-            if current_event.event_type == 'txn_generation':
-                peer.generate_transaction(current_time)
-            elif current_event.event_type == 'txn_receive':
-                peer.receive_transaction(current_event.data, current_time)
-            elif current_event.event_type == 'blk_generation':
-                peer.generate_block(current_time)
-            elif current_event.event_type == 'blk_mining':
-                peer.mine_block(current_time, current_event.data)
-            elif current_event.event_type == 'blk_receive':
-                peer.receive_block(current_time, current_event.data)
-        
-        while event_queue:
-            current_event = heapq.heappop(event_queue)
-            current_time = current_event.event_time
-            peer = self.find_peer_by_id(current_event.peer_id)
-            if current_event.event_type == 'blk_receive':
-                peer.receive_block(current_time, current_event.data)
+        processed=0
+        while True:
+            until=self.simulation_duration
+            if self.checkpoint_interval and self.next_checkpoint < until:
+                until=self.next_checkpoint
+            processed+=self.process_events(EVENT_HANDLERS, until)
+            if until >= self.simulation_duration or not self.event_queue:
+                break
+            self.next_checkpoint+=self.checkpoint_interval
+            save_checkpoint(self, os.path.join(self.checkpoint_dir, f"checkpoint_{until:g}.pkl"))
+        if self.instrumentation is not None:
+            self.instrumentation.next_report=None
+        #After the duration, only pending blocks are still delivered
+        processed+=self.process_events(DRAIN_HANDLERS, float('inf'))
+
+        self.write_summary()
+        if self.instrumentation is not None and self.profile_path:
+            self.instrumentation.compacted=self.event_queue.compacted
+            self.instrumentation.write_report(self.profile_path)
+        return processed
+
+    #Function to run the simulation on num_partitions worker processes instead, see parallel.py.
+    #The metrics are replaced by those gathered from the workers, returns the number of events processed
+    #and the tree snapshots of the peers in snapshot_peers.
+    def run_parallel(self, num_partitions, snapshot_peers=()):
+        from parallel import run_parallel
+        processed, self.metrics, snapshots=run_parallel(self, num_partitions, snapshot_peers)
+        self.write_summary()
+        return processed, snapshots
+
+    #Function to save the state every interval simulated seconds while running, into directory
+    def enable_checkpoints(self, interval, directory='checkpoints'):
+        os.makedirs(directory, exist_ok=True)
+        self.checkpoint_interval=interval
+        self.checkpoint_dir=directory
+        self.next_checkpoint=(self.current_time//interval+1)*interval
+
+    #Function to process events until the queue is empty or an event past until has been handled
+    def process_events(self, handlers, until):
+        current_time=self.current_time
+        processed=0
+        peer_table=self.peer_table
+        event_queue=self.event_queue
+        pop=event_queue.pop
+        instrumentation=self.instrumentation
+        trace=self.trace
+        if instrumentation is None and trace is None:
+            while current_time <= until:
+                try:
+                    current_time, _, event_type, peer_id, data = pop()
+                except IndexError:
+                    break
+                handlers[event_type](peer_table[peer_id], current_time, data)
+                processed+=1
+        else:
+            clock=time.perf_counter
+            while current_time <= until:
+                try:
+                    current_time, _, event_type, peer_id, data = pop()
+                except IndexError:
+                    break
+                if trace is not None:
+                    trace.event(current_time, event_type, peer_id, data)
+                if instrumentation is None:
+                    handlers[event_type](peer_table[peer_id], current_time, data)
+                else:
+                    start=clock()
+                    handlers[event_type](peer_table[peer_id], current_time, data)
+                    instrumentation.event_done(event_type, clock()-start, current_time, len(event_queue))
+                processed+=1
+        self.current_time=current_time
+        return processed
+
+    #Function to attach instrumentation to the event loop and all peers
+    def instrument(self, report_interval=None, profile_path=None):
+        self.instrumentation=Instrumentation(report_interval)
+        self.profile_path=profile_path
+        for peer in self.peer_table:
+            peer.instrumentation=self.instrumentation
+
+    #Function to make all peers relay blocks as compact blocks, see Peer.relay_block
+    def enable_compact_relay(self):
+        for peer in self.peer_table:
+            peer.compact_relay=True
+
+    #Function to hash every processed event from now on, see TraceHash
+    def enable_trace_hash(self):
+        self.trace=TraceHash()
+        return self.trace
     
-    #Function for developing graphs of blockchain for each node
-    def visualize_blockchain(self, peer:Peer):
-        G = nx.DiGraph()
-        plt.figure(figsize=(5,10))
+    #Function to capture what is drawn for a peer's block tree, equal snapshots give identical pictures
+    def tree_snapshot(self, peer):
         blockchain = peer.private_chain
-        levels = {}
-        for index, blocks in blockchain.blocks.items():
-            for block in blocks:
-                G.add_node(block.blk_id, label=f"{block.index}")
-                if block.index not in levels:
-                    levels[block.index] = []
-                levels[block.index].append(block.blk_id)
-
-        for index, blocks in blockchain.blocks.items():
-            for block in blocks:
-                if block.prev_blk_id != -1:
-                    G.add_edge(block.prev_blk_id, block.blk_id)
-
-        # Position nodes from top to bottom, equidistant horizontally
-        pos = {}
-        x_spacing = 0.1
-        y_spacing = 2
-        for level, nodes in levels.items():
-            y = -level * y_spacing
-            for i, node in enumerate(nodes):
-                pos[node] = (i * x_spacing, y)
-
-        # Draw the graph
-        labels = nx.get_node_attributes(G, 'label')
-        node_colors = []
-        for block_id ,blocks in blockchain.blocks.items():
-            for block in blocks:
-                # if self.find_peer_by_id(block.miner_id) in self.selfish_miners:
-                if block.miner_id >= self.num_peers:  
-                    node_colors.append('red' if self.find_peer_by_id(block.miner_id).peer_id == self.selfish_miners[0].peer_id else 'blue')
-                else:
-                    node_colors.append('skyblue')        
-        nx.draw(G, pos, with_labels=True, labels=labels, node_size=100, node_color=node_colors, font_size=3, node_shape='s')
-        longest_path=nx.dag_longest_path(G)
-        main_chain_blocks=0
+        blocks=tuple(sorted((block.index, block.blk_id, block.prev_blk_id, block.miner_id) for block in blockchain.all_blocks()))
+        main_chain={block.blk_id for block in self.main_chain(peer)}
         total_blocks=0
-        for blklist in peer.private_chain.blocks.values():
-            for blk in blklist:
-                if blk.miner_id == peer.peer_id:
-                    total_blocks+=1
-                    if blk.blk_id in longest_path:
-                        main_chain_blocks+=1
-        plt.text(0,0, f'Total Blocks: {sum([len(lst) for lst in peer.private_chain.blocks.values()])}\nBlocks in Longest Chain: {max(blockchain.blocks.keys())+1}\nTotal Blocks by Peer: {total_blocks}\nBlocks in Longest Chain by Peer: {main_chain_blocks}', fontsize=13, color='black')
-        plt.title("Blockchain Visualization")
-        plt.savefig(f"visuals/Blockchain_{peer.peer_id}.png")
-        plt.close()
+        main_chain_blocks=0
+        for index, blk_id, prev_blk_id, miner_id in blocks:
+            if miner_id == peer.peer_id:
+                total_blocks+=1
+                if blk_id in main_chain:
+                    main_chain_blocks+=1
+        text=f'Total Blocks: {len(blocks)}\nBlocks in Longest Chain: {blockchain.last_block.index+1}\nTotal Blocks by Peer: {total_blocks}\nBlocks in Longest Chain by Peer: {main_chain_blocks}'
+        return (blocks, self.num_peers, text)
+
+    #Function for developing graphs of blockchain for each node
+    def visualize_blockchain(self, peer:Peer):
+        render_tree(self.tree_snapshot(peer), f"visuals/Blockchain_{peer.peer_id}.png")
+
+    #Function to get the blocks of the longest chain seen by a peer, from its tip back to genesis
+    def main_chain(self, peer):
+        chain=[]
+        block=peer.private_chain.last_block
+        while block is not None:
+            chain.append(block)
+            block=peer.private_chain.find_block_by_id(block.prev_blk_id)
+        return chain
+
+    #Function to get the MPU of both adversaries and of the whole network, kept up to date by ChainMetrics.
+    #The main chain is the one seen by an honest peer, the genesis block is not counted.
+    #MPU_adv = adversary blocks in the main chain / blocks mined by the adversary
+    #MPU_overall = blocks in the main chain / blocks mined in total
+    def mpu_stats(self):
+        return self.metrics.summary()
+
+    #Function to get mpu_stats for JSON output, an MPU that is undefined because nothing was mined (nan) becomes null
+    def summary_json(self):
+        return {name: None if value != value else value for name, value in self.mpu_stats().items()}
+
+    #Function to write the summary to summary_path as strict JSON
+    def write_summary(self):
+        if self.summary_path:
+            with open(self.summary_path, 'w') as file:
+                json.dump(self.summary_json(), file, indent=2, allow_nan=False)
 
     #Function for proper maintenance of block tree files for each node.
     def find_block_by_id(self,blk_id,peer):
-        for value in peer.private_chain.blocks.values():
-            for block in value:
-                if block.blk_id == blk_id:
-                    return block
-        return None
+        return peer.private_chain.find_block_by_id(blk_id)
+
+    #Function to choose the peers whose trees are drawn: all peers, or sample randomly chosen honest peers and both adversaries
+    def render_peers(self, sample=None):
+        peers=self.peers
+        if sample is not None and sample < len(peers):
+            peers=[peers[i] for i in sorted(self.streams.render.choice(len(peers), sample, replace=False).tolist())]
+        return peers+self.selfish_miners
 
-    def plot_blockchain_tree(self):
-        for peer in self.peers+self.selfish_miners:
-            self.visualize_blockchain(peer)
+    #Function to draw the block trees of the peers chosen by render_peers, or the given snapshots by peer_id.
+    #Peers with identical trees are drawn once and the picture is copied, distinct trees are drawn in worker processes.
+    def plot_blockchain_tree(self, sample=None, workers=None, snapshots=None):
+        if snapshots is None:
+            snapshots={peer.peer_id: self.tree_snapshot(peer) for peer in self.render_peers(sample)}
+        filenames={}
+        for peer_id, snapshot in snapshots.items():
+            filenames.setdefault(snapshot, []).append(f"visuals/Blockchain_{peer_id}.png")
+
+        snapshots=list(filenames)
+        first_files=[filenames[snapshot][0] for snapshot in snapshots]
+        if workers == 1 or len(snapshots) == 1:
+            for snapshot, filename in zip(snapshots, first_files):
+                render_tree(snapshot, filename)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(render_tree, snapshots, first_files))
+        for snapshot in snapshots:
+            for filename in filenames[snapshot][1:]:
+                shutil.copyfile(filenames[snapshot][0], filename)
     
-    #Function for writing block tree files for each node
+    #Function to stream the block arrivals of every peer to a log in the given format ('csv' or 'binary').
+    #With resume the files start from their content at the checkpoint this run was loaded from, cut back in place
+    #or copied from the log directory of the checkpointed run when directory is another one.
+    def open_block_log(self, directory='block_tree_files', log_format='csv', combined=False, resume=False):
+        offsets=self.log_offsets if resume else None
+        self.block_log=LOG_FORMATS[log_format](directory, [peer.peer_id for peer in self.peer_table], combined,
+                                               offsets=offsets, source_directory=self.log_directory)
+        self.log_directory=os.path.abspath(directory)
+        for peer in self.peer_table:
+            peer.block_log=self.block_log
+
+    #Function for writing the remaining block tree records of each node
     def write_files(self):
-        for peer in self.peers:
-            lines=peer.file_writing_lines
-            with open(f'block_tree_files/block_tree_{peer.peer_id}','w') as file:
-                file.writelines(lines)
+        if self.block_log is not None:
+            self.block_log.close()
 
-#Main function 
-if __name__=="__main__":
-    if(len(sys.argv)<9):
-        print(f"Usage: {sys.argv[0]} <num_peers> <slow_%> <low_cpu_%> <mean_txn_time> <mean_blkgen_time> <duration> <hashing_power1> <hashing_power2>")
-        sys.exit(1)
-        
-        
-    #Taking arguments for simulation as input
-    num_peers = int(sys.argv[1])
-    slow_percentage = int(sys.argv[2])
-    low_cpu_percentage = int(sys.argv[3])
-    mean_transaction_time = int(sys.argv[4])
-    mean_block_generation_time = int(sys.argv[5])
-    simulation_duration = int(sys.argv[6])
-    hashing_power1 = int(sys.argv[7])
-    hashing_power2 = int(sys.argv[8])
+#Function to create peers, a connected network and the initial events of a simulation.
+#The same seed and parameters give the same run, a random seed is drawn if seed is None.
+def build_simulation(num_peers, slow_percentage, low_cpu_percentage, mean_transaction_time, mean_block_generation_time, simulation_duration, hashing_power1, hashing_power2, seed=None, scheduler='heap'):
+    #Ids of a previous simulation in the same process must not leak into this one
+    reset_counters()
 
     # Creating an object of Simulation Class
-    simulation= Simulation(num_peers, slow_percentage, low_cpu_percentage, simulation_duration)
+    simulation= Simulation(num_peers, slow_percentage, low_cpu_percentage, simulation_duration, seed, scheduler)
     
-    # Speed of Light delay while propagation of
-    speed_of_light_delay=np.random.uniform(0.01, 0.5, size=(num_peers+2, num_peers+2))
+    # Speed of Light delay while propagation of, drawn only for the links of the generated network
+    speed_of_light_delay=LinkLatencies(0.01, 0.5, simulation.streams.latency)
 
     print("Creating peers...")
     simulation.initialize_peers(speed_of_light_delay, mean_block_generation_time, hashing_power1, hashing_power2)
@@ -246,20 +543,93 @@ if __name__=="__main__":
         simulation.recreate_graph()
     
     print("Adding Events to the Queue...")
-    simulation.initialize_events(simulation_duration, mean_transaction_time)
-    
-    print("Running Simulation...")
-    # simulation.send_genesis_block()
+    simulation.initialize_events(mean_transaction_time)
     simulation.genesis_block_receive()
-    simulation.run_simulation(simulation_duration)
+    return simulation
+
+#Main function 
+def main():
+    parser=argparse.ArgumentParser(usage="%(prog)s <num_peers> <slow_%%> <low_cpu_%%> <mean_txn_time> <mean_blkgen_time> <duration> <hashing_power1> <hashing_power2> [options]\n       %(prog)s --resume <checkpoint> [options]")
+    parser.add_argument('parameters', type=int, nargs='*', help='num_peers slow_%% low_cpu_%% mean_txn_time mean_blkgen_time duration hashing_power1 hashing_power2')
+    parser.add_argument('--no-render', action='store_true', help='skip drawing the block trees')
+    parser.add_argument('--render-sample', type=int, default=None, help='draw the trees of only this many random honest peers plus both adversaries')
+    parser.add_argument('--render-workers', type=int, default=None, help='worker processes for drawing (default: all cores)')
+    parser.add_argument('--log-format', choices=['csv', 'binary'], default='csv', help='format of the block tree files')
+    parser.add_argument('--combined-log', action='store_true', help='write one CSV file for all peers instead of one per peer')
+    parser.add_argument('--summary', default='summary.json', help='file for the JSON summary of MPU and forks, in --output-dir')
+    parser.add_argument('--profile', default=None, help='instrument the event loop and write a JSON report to this file')
+    parser.add_argument('--profile-interval', type=float, default=None, help='with --profile, print a progress line every this many simulated seconds')
+    parser.add_argument('--checkpoint-interval', type=float, default=None, help='save the state every this many simulated seconds')
+    parser.add_argument('--checkpoint-dir', default='checkpoints', help='directory of the checkpoints, in --output-dir')
+    parser.add_argument('--resume', default=None, help='continue the simulation saved in this checkpoint')
+    parser.add_argument('--fork-seed', type=int, default=None, help='with --resume, reseed the random streams to fork a different continuation')
+    parser.add_argument('--output-dir', default=None, help='directory of the block tree files, the summary and the checkpoints (default: fork_<seed> with --fork-seed, else the current directory)')
+    parser.add_argument('--duration', type=int, default=None, help='with --resume, run until this simulated time instead of the saved duration')
+    parser.add_argument('--compact-blocks', action='store_true', help='relay blocks as compact blocks and fetch only the missing transactions')
+    parser.add_argument('--scheduler', choices=sorted(SCHEDULERS), default='heap', help='event queue implementation')
+    parser.add_argument('--parallel', type=int, default=None, help='run on this many worker processes, each simulating a partition of the network')
+    parser.add_argument('--seed', type=int, default=None, help='seed of all random streams (default: random, printed at the start)')
+    parser.add_argument('--trace-hash', action='store_true', help='print a digest of the processed event sequence')
+    parser.add_argument('--expect-trace', default=None, help='exit with an error unless the digest of the event sequence equals this one')
+    #Taking arguments for simulation as input
+    args=parser.parse_args()
+    if args.parallel and (args.resume or args.checkpoint_interval or args.profile or args.trace_hash or args.expect_trace
+                          or args.log_format != 'csv' or args.combined_log):
+        parser.error('--parallel writes one CSV block log per peer and cannot be combined with checkpoints, profiling or trace hashes')
+
+    if args.resume:
+        print("Loading checkpoint...")
+        simulation=load_checkpoint(args.resume, args.fork_seed)
+        if args.duration is not None:
+            simulation.simulation_duration=args.duration
+    elif len(args.parameters) == 8:
+        num_peers, slow_percentage, low_cpu_percentage, mean_transaction_time, mean_block_generation_time, simulation_duration, hashing_power1, hashing_power2 = args.parameters
+        simulation=build_simulation(num_peers, slow_percentage, low_cpu_percentage, mean_transaction_time, mean_block_generation_time, simulation_duration, hashing_power1, hashing_power2, args.seed, args.scheduler)
+    else:
+        parser.print_usage()
+        sys.exit(1)
+    
+    #Forked continuations write next to the run they were forked from instead of over it
+    output_dir=args.output_dir
+    if output_dir is None:
+        output_dir=f'fork_{args.fork_seed}' if args.resume and args.fork_seed is not None else '.'
+    os.makedirs(output_dir, exist_ok=True)
+    simulation.open_block_log(os.path.join(output_dir, 'block_tree_files'), args.log_format, args.combined_log, resume=bool(args.resume))
+    simulation.summary_path=os.path.join(output_dir, args.summary)
+    if args.profile:
+        simulation.instrument(args.profile_interval, args.profile)
+    if args.compact_blocks:
+        simulation.enable_compact_relay()
+    if args.checkpoint_interval:
+        simulation.enable_checkpoints(args.checkpoint_interval, os.path.join(output_dir, args.checkpoint_dir))
+    trace=simulation.enable_trace_hash() if args.trace_hash or args.expect_trace else None
+    
+    print(f"Running Simulation with seed {simulation.streams.seed}...")
+    snapshots=None
+    if args.parallel:
+        snapshot_peers=[] if args.no_render else [peer.peer_id for peer in simulation.render_peers(args.render_sample)]
+        processed, snapshots=simulation.run_parallel(args.parallel, snapshot_peers)
+    else:
+        simulation.run_simulation(simulation.simulation_duration)
     simulation.display_network()
     print("Simulation Completed")
+    print(json.dumps(simulation.summary_json()))
+    if trace is not None:
+        print(f"Trace hash: {trace.hexdigest()} ({trace.events} events)")
+        if args.expect_trace and trace.hexdigest() != args.expect_trace:
+            print(f"Trace hash differs from the expected {args.expect_trace}")
+            sys.exit(1)
     
-    print("Drawing Pictures for Visualisation...")
-    simulation.plot_blockchain_tree()
+    if not args.no_render:
+        print("Drawing Pictures for Visualisation...")
+        simulation.plot_blockchain_tree(args.render_sample, args.render_workers, snapshots)
     
     print("Writing the block tree files...")
     simulation.write_files()
     
     print("Process Completed .. 100%")    
 
+if __name__=="__main__":
+    #Run through the imported module so checkpoints refer to sim.Simulation rather than __main__
+    import sim
+    sim.main()
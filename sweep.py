@@ -0,0 +1,116 @@
+#Parameter sweep runner
+#Runs the simulation for every combination of the given parameter values, several replicas each,
+#in parallel across cores, and writes a table and plots of MPU_adv and MPU_overall with 95% confidence intervals.
+#
+#  python3 sweep.py --h1 10 20 30 40 --h2 10 --n 50 --t 5000 --replicas 8
+
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sim import build_simulation
+from mpucalculation import plot_mpu
+
+PARAMETERS=['h1', 'h2', 'n', 'z0', 'z1', 'T', 'I', 't']
+MPU_COLUMNS=['mpu_adv1', 'mpu_adv2', 'mpu_overall']
+
+#Function to run one replica of one parameter combination, executed in a worker process
+def run_replica(params, seed):
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation=build_simulation(params['n'], params['z0'], params['z1'], params['T'], params['I'], params['t'], params['h1'], params['h2'], seed)
+        simulation.run_simulation(params['t'])
+    return simulation.mpu_stats()
+
+#97.5% quantiles of Student's t distribution for 1 to 30 degrees of freedom
+T_QUANTILES=[12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+             2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+             2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+#Function to get the 97.5% quantile of Student's t distribution, the Cornish-Fisher expansion beyond the table
+def t_quantile(degrees_of_freedom):
+    if degrees_of_freedom <= len(T_QUANTILES):
+        return T_QUANTILES[degrees_of_freedom-1]
+    z=1.959964
+    return z+(z**3+z)/(4*degrees_of_freedom)+(5*z**5+16*z**3+3*z)/(96*degrees_of_freedom**2)
+
+#Function to get the mean and the half width of the 95% confidence interval of a list of values
+def mean_and_ci(values):
+    values=[value for value in values if not math.isnan(value)]
+    if not values:
+        return float('nan'), float('nan')
+    mean=sum(values)/len(values)
+    if len(values) < 2:
+        return mean, float('nan')
+    std=np.std(values, ddof=1)
+    return mean, t_quantile(len(values)-1)*std/math.sqrt(len(values))
+
+def run_sweep(grid, replicas, seed=0, workers=None):
+    combinations=[dict(zip(PARAMETERS, values)) for values in itertools.product(*(grid[name] for name in PARAMETERS))]
+    results={i: [] for i in range(len(combinations))}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures={}
+        for i, params in enumerate(combinations):
+            for replica in range(replicas):
+                futures[pool.submit(run_replica, params, seed+i*replicas+replica)]=i
+        for future, i in futures.items():
+            results[i].append(future.result())
+
+    rows=[]
+    for i, params in enumerate(combinations):
+        row=dict(params)
+        row['replicas']=len(results[i])
+        for column in MPU_COLUMNS:
+            row[column], row[column+'_ci']=mean_and_ci([stats[column] for stats in results[i]])
+        rows.append(row)
+    return rows
+
+def write_table(rows, path):
+    with open(path, 'w', newline='') as file:
+        writer=csv.DictWriter(file, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+#Function to plot MPU against the first swept parameter, one figure per combination of the other parameters
+def plot_rows(rows, grid, output_dir):
+    swept=[name for name in PARAMETERS if len(grid[name]) > 1] or ['h1']
+    x_name=swept[0]
+    groups={}
+    for row in rows:
+        key=tuple((name, row[name]) for name in swept[1:])
+        groups.setdefault(key, []).append(row)
+    for key, group in groups.items():
+        group.sort(key=lambda row: row[x_name])
+        suffix=''.join(f'_{name}{value}' for name, value in key)
+        plot_mpu([row[x_name] for row in group],
+                 {column: ([row[column] for row in group], [row[column+'_ci'] for row in group]) for column in MPU_COLUMNS},
+                 x_name, os.path.join(output_dir, f'mpu_vs_{x_name}{suffix}.png'))
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description='Run a grid of simulations in parallel and aggregate the MPU of the adversaries')
+    parser.add_argument('--h1', type=int, nargs='+', default=[20], help='hashing power of selfish miner 1 (%%)')
+    parser.add_argument('--h2', type=int, nargs='+', default=[20], help='hashing power of selfish miner 2 (%%)')
+    parser.add_argument('--n', type=int, nargs='+', default=[50], help='number of honest peers')
+    parser.add_argument('--z0', type=int, nargs='+', default=[30], help='percentage of slow peers')
+    parser.add_argument('--z1', type=int, nargs='+', default=[30], help='percentage of low CPU peers')
+    parser.add_argument('--T', type=int, nargs='+', default=[10], help='mean transaction interarrival time')
+    parser.add_argument('--I', type=int, nargs='+', default=[60], help='mean block generation time')
+    parser.add_argument('--t', type=int, nargs='+', default=[5000], help='simulation duration')
+    parser.add_argument('--replicas', type=int, default=5, help='runs per parameter combination')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first run, each run gets its own seed')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--output', default='sweep_results', help='directory for the table and the plots')
+    args=parser.parse_args()
+
+    grid={name: getattr(args, name) for name in PARAMETERS}
+    os.makedirs(args.output, exist_ok=True)
+    rows=run_sweep(grid, args.replicas, args.seed, args.workers)
+    write_table(rows, os.path.join(args.output, 'results.csv'))
+    plot_rows(rows, grid, args.output)
+    print(f"Results written to {args.output}")
@@ -1,17 +1,27 @@
-import shortuuid
+from itertools import count
+
+#Transaction ids are small increasing integers shared by transactions and coinbases
+txn_ids=count()
 
 #Structure of Transactions
 class Transaction:
     def __init__(self, peer_id1, peer_id2, amount):
-        self.txn_id=shortuuid.uuid()
+        self.txn_id=next(txn_ids)
         self.sender=peer_id1
         self.receiver=peer_id2
         self.amount=amount
-        self.statement=f"{self.txn_id}:{self.sender} pays {self.receiver} {amount} coins"
+
+    #Statement is only formatted when it is read
+    @property
+    def statement(self):
+        return f"{self.txn_id}:{self.sender} pays {self.receiver} {self.amount} coins"
 
 #Structure of coinbase transactions
 class Coinbase:
     def __init__(self, peer_id):
-        self.txn_id=shortuuid.uuid()
+        self.txn_id=next(txn_ids)
         self.miner=peer_id
-        self.statement=f"{self.txn_id}:{self.miner} mines 50 coins"
\ No newline at end of file
+
+    @property
+    def statement(self):
+        return f"{self.txn_id}:{self.miner} mines 50 coins"
\ No newline at end of file